@@ -1,10 +1,13 @@
 import yaml
 
+from app_func.config_store import get_config_store
+
 # Paths to configuration files
 CONFIG_FOLDER = "config/"
 B_PARAMS = CONFIG_FOLDER + "brillouin_params.yaml"
 F_PARAMS = CONFIG_FOLDER + "fluo_params.yaml"
 CONFIG = CONFIG_FOLDER + "galvo_pi_config.yaml"
+MOTION_CALIBRATION = CONFIG_FOLDER + "motion_calibration.yaml"
 SYS_CONFIG = r"C:\Program Files\Micro-Manager-2.0\Hamamatsu\orcaFlash_orcaQuest.cfg"
 # Alternative configuration file (commented out)
 #SYS_CONFIG = r"C:\Program Files\Micro-Manager-2.0\Hamamatsu\orcaflash4.cfg"
@@ -18,6 +21,14 @@ pi2_val = 80
 pi3_val = 14.35
 pi4_val = 12
 
+# Travel range (min, max) of each PI controller: Z, rotation, X and Y stages
+PI_LIMITS = {
+    1: (8, 16.999),
+    2: (-360, 360),
+    3: (4, 16.999),
+    4: (0.001, 16.999),
+}
+
 # List to store PI widgets (e.g., motor controllers)
 pi_widgets = []
 
@@ -53,6 +64,9 @@ def save_params_for_all_widgets(pi_widgets):
     Decorator that ensures all widgets save their parameters
     before executing the wrapped function.
 
+    The widgets only update the shared configuration store, which is written
+    once to CONFIG after the wrapped function returns.
+
     Args:
         pi_widgets (list): List of widget objects that may have a save_params method.
 
@@ -65,7 +79,10 @@ def save_params_for_all_widgets(pi_widgets):
             for widget in pi_widgets:
                 if hasattr(widget, "save_params"):
                     widget.save_params()
-            return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                get_config_store(CONFIG).flush()
 
         return wrapper
 
@@ -0,0 +1,248 @@
+import threading
+import time
+
+import PyDAQmx
+from PyDAQmx import (
+    Task,
+)
+from pymmcore_plus import (
+    CMMCorePlus,
+)
+
+# Camera properties switching the Hamamatsu DCAM adapter to external triggering
+EXTERNAL_TRIGGER = {
+    "TRIGGER SOURCE": "EXTERNAL",
+    "TRIGGER ACTIVE": "EDGE",
+    "TriggerPolarity": "POSITIVE",
+}
+
+
+# Read-only property of the Hamamatsu DCAM adapter giving the frame readout
+READOUT_PROPERTY = "ReadoutTime"
+
+
+def camera_readout(
+    core: CMMCorePlus,
+) -> float:
+    """
+    Returns the readout time (s) of a frame of the current camera.
+
+    Parameters:
+    - core: Micro-Manager core.
+
+    Returns:
+    - float: Readout time, 0.0 if the camera does not report it.
+    """
+    camera = core.getCameraDevice()
+    if not camera or not core.hasProperty(camera, READOUT_PROPERTY):
+        return 0.0
+    try:
+        # Micro-Manager times are in ms
+        return float(core.getProperty(camera, READOUT_PROPERTY)) / 1000
+    except ValueError:
+        return 0.0
+
+
+def set_camera_trigger(
+    core: CMMCorePlus,
+    properties: dict,
+):
+    """
+    Applies trigger properties to the current camera.
+
+    Properties the camera does not expose are skipped.
+
+    Parameters:
+    - core: Micro-Manager core.
+    - properties: Property name -> value to apply.
+
+    Returns:
+    - dict: Previous values of the modified properties, to restore them later.
+    """
+    camera = core.getCameraDevice()
+    previous = {}
+    for name, value in properties.items():
+        if not core.hasProperty(camera, name):
+            continue
+        previous[name] = core.getProperty(camera, name)
+        core.setProperty(camera, name, value)
+    return previous
+
+
+def camera_trigger_task(
+    counter: str = "/Dev1/ctr1",
+    pulse_width: float = 0.001,
+    start_trigger: str = "/Dev1/PFI12",
+):
+    """
+    Creates a committed counter task emitting one camera trigger pulse per start.
+
+    The task is committed once, so each StartTask/StopTask pair only costs a
+    register write instead of a full task setup.
+
+    Parameters:
+    - counter: Counter output wired to the camera trigger input.
+    - pulse_width: High and low time of the pulse, in seconds.
+    - start_trigger: Terminal arming the pulse (PFI12 is the galvo clock, so
+      triggers stay aligned with the light sheet). None to fire immediately.
+
+    Returns:
+    - Task: The configured task.
+    """
+    task = Task()
+    task.CreateCOPulseChanTime(
+        counter,
+        "",
+        PyDAQmx.DAQmx_Val_Seconds,
+        PyDAQmx.DAQmx_Val_Low,
+        0,
+        pulse_width,
+        pulse_width,
+    )
+    task.CfgImplicitTiming(
+        PyDAQmx.DAQmx_Val_FiniteSamps,
+        1,
+    )
+    if start_trigger:
+        task.CfgDigEdgeStartTrig(
+            start_trigger,
+            PyDAQmx.DAQmx_Val_Rising,
+        )
+    task.TaskControl(PyDAQmx.DAQmx_Val_Task_Commit)
+    return task
+
+
+def camera_pulse_train_task(
+    rate: float,
+    count: int,
+    counter: str = "/Dev1/ctr1",
+    start_trigger: str = "/Dev1/PFI12",
+):
+    """
+    Creates a counter task emitting a finite train of camera trigger pulses.
+
+    Parameters:
+    - rate: Pulse frequency, in Hz.
+    - count: Number of pulses.
+    - counter: Counter output wired to the camera trigger input.
+    - start_trigger: Terminal arming the train. None to fire immediately.
+
+    Returns:
+    - Task: The configured task, ready to be started.
+    """
+    half_period = 1 / (2 * rate)
+    task = Task()
+    task.CreateCOPulseChanTime(
+        counter,
+        "",
+        PyDAQmx.DAQmx_Val_Seconds,
+        PyDAQmx.DAQmx_Val_Low,
+        0,
+        half_period,
+        half_period,
+    )
+    task.CfgImplicitTiming(
+        PyDAQmx.DAQmx_Val_FiniteSamps,
+        count,
+    )
+    if start_trigger:
+        task.CfgDigEdgeStartTrig(
+            start_trigger,
+            PyDAQmx.DAQmx_Val_Rising,
+        )
+    task.TaskControl(PyDAQmx.DAQmx_Val_Task_Commit)
+    return task
+
+
+def fire_trigger(
+    task: Task,
+    timeout: float = 1.0,
+):
+    """
+    Emits a single pulse with a task built by camera_trigger_task().
+    """
+    task.StartTask()
+    task.WaitUntilTaskDone(timeout)
+    task.StopTask()
+
+
+class SequenceDrain:
+    """
+    Pulls frames from the Micro-Manager circular buffer on a background thread.
+
+    Each frame is handed to on_frame(i, img, metadata) in acquisition order, so
+    the circular buffer is emptied while the stage keeps moving.
+    """
+
+    def __init__(
+        self,
+        core: CMMCorePlus,
+        count: int,
+        on_frame,
+        poll: float = 0.001,
+    ):
+        """
+        Parameters:
+        - core: Micro-Manager core running the sequence acquisition.
+        - count: Number of frames expected.
+        - on_frame: Callable receiving (index, image, metadata) for each frame.
+        - poll: Sleep time when the buffer is empty, in seconds.
+        """
+        self.core = core
+        self.count = count
+        self.on_frame = on_frame
+        self.poll = poll
+        self.received = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="SequenceDrain",
+            daemon=True,
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def wait(
+        self,
+        timeout: float = 5.0,
+    ):
+        """
+        Waits until every expected frame has been drained.
+
+        Parameters:
+        - timeout: Maximum time to wait without receiving a new frame.
+
+        Returns:
+        - bool: True if all frames were received.
+        """
+        last = self.received
+        deadline = time.perf_counter() + timeout
+        while self._thread.is_alive() and time.perf_counter() < deadline:
+            self._thread.join(0.05)
+            if self.received != last:
+                last = self.received
+                deadline = time.perf_counter() + timeout
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        return self.received == self.count
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            while self.received < self.count and not self._stop.is_set():
+                if self.core.getRemainingImageCount() > 0:
+                    img, metadata = self.core.popNextImageAndMD()
+                    self.on_frame(self.received, img, metadata)
+                    self.received += 1
+                else:
+                    time.sleep(self.poll)
+        except Exception as e:
+            print(f"[ERROR] Could not drain camera buffer: {e}")
+            self.error = e
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+CHECKPOINT_NAME = "scan_checkpoint.json"
+DONE_NAME = "scan_checkpoint.npy"
+
+
+class ScanCheckpoint:
+    """
+    Progress of a scan, saved in its output folder so it can be resumed.
+
+    scan_checkpoint.json holds the scan parameters, the trajectory index of
+    the last saved voxel and whether the scan finished. scan_checkpoint.npy
+    holds a boolean mask over the scan grid of the voxels already saved. Both
+    files are replaced atomically, at most every `interval` seconds while the
+    scan runs, and when it stops.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = 5.0,
+    ):
+        """
+        Parameters:
+        - path: Output folder of the scan.
+        - interval: Minimum time (s) between two saves during the scan.
+        """
+        self.path = path
+        self.interval = interval
+        self.params = None
+        self.done = None
+        self.last_index = -1
+        self.finished = False
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, CHECKPOINT_NAME))
+
+    def interrupted(self) -> bool:
+        """
+        Returns True if the folder holds a scan that did not finish.
+        """
+        if not self.exists():
+            return False
+        with open(os.path.join(self.path, CHECKPOINT_NAME), "r") as file:
+            return not json.load(file)["finished"]
+
+    def start(
+        self,
+        params: dict,
+        shape,
+    ):
+        """
+        Starts the checkpoint of a new scan.
+
+        Parameters:
+        - params: Scan parameters, a resumed scan must use the same.
+        - shape: Scan grid shape as (num_z, num_x, num_y).
+        """
+        with self._lock:
+            self.params = dict(params)
+            self.done = np.zeros(tuple(shape), dtype=bool)
+            self.last_index = -1
+            self.finished = False
+        self.save()
+
+    def load(
+        self,
+        params: dict,
+    ):
+        """
+        Loads the checkpoint of an interrupted scan.
+
+        Raises ValueError if there is none, or if it was made with other
+        parameters.
+        """
+        if not self.exists():
+            raise ValueError(f"No scan to resume in {self.path}")
+        with open(os.path.join(self.path, CHECKPOINT_NAME), "r") as file:
+            state = json.load(file)
+        if state["params"] != dict(params):
+            raise ValueError("The scan parameters differ from the checkpoint")
+        with self._lock:
+            self.params = state["params"]
+            self.last_index = state["last_index"]
+            self.finished = state["finished"]
+            self.done = np.load(os.path.join(self.path, DONE_NAME))
+
+    def mark_done(
+        self,
+        index,
+        trajectory_index: int = None,
+    ):
+        """
+        Marks a voxel as saved (called by the writer thread).
+
+        Parameters:
+        - index: (z, x, y) position of the voxel in the scan grid.
+        - trajectory_index: Position of the voxel in the scan trajectory.
+        """
+        with self._lock:
+            self.done[tuple(index)] = True
+            if trajectory_index is not None:
+                self.last_index = max(self.last_index, trajectory_index)
+            due = time.perf_counter() - self._saved_at >= self.interval
+        if due:
+            self.save()
+
+    def remaining(
+        self,
+        indices,
+    ):
+        """
+        Returns a boolean mask of the (N, 3) grid indices not saved yet.
+        """
+        with self._lock:
+            return ~self.done[indices[:, 0], indices[:, 1], indices[:, 2]]
+
+    def save(
+        self,
+        finished: bool = None,
+    ):
+        with self._lock:
+            if finished is not None:
+                self.finished = finished
+            state = {
+                "params": self.params,
+                "last_index": int(self.last_index),
+                "finished": self.finished,
+                "done": int(self.done.sum()),
+                "total": int(self.done.size),
+            }
+            done = self.done.copy()
+            self._saved_at = time.perf_counter()
+        # the mask is written first, the json tells which scan it belongs to
+        _replace(
+            os.path.join(self.path, DONE_NAME),
+            lambda file: np.save(file, done),
+            "wb",
+        )
+        _replace(
+            os.path.join(self.path, CHECKPOINT_NAME),
+            lambda file: json.dump(state, file, indent=2),
+            "w",
+        )
+
+
+def _replace(
+    path: str,
+    write,
+    mode: str,
+):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode) as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,158 @@
+import atexit
+import os
+import tempfile
+import threading
+
+import yaml
+
+
+class ConfigStore:
+    """
+    In-memory copy of a YAML configuration file shared by the whole process.
+
+    The file is read once. Updates only change the memory copy and schedule a
+    write after `delay` seconds, so a burst of updates (e.g. "Save All
+    Params") ends up in a single write. The file is written to a temporary
+    file which then replaces the original, so a crash never leaves a
+    truncated configuration behind.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        delay: float = 0.5,
+    ):
+        """
+        Parameters:
+        - path: YAML file backing the store.
+        - delay: Time (s) to wait for more updates before writing the file.
+        """
+        self.path = os.path.abspath(path)
+        self.delay = delay
+        self._data = None
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def exists(self) -> bool:
+        """
+        Returns True if the store holds values, either read or updated.
+        """
+        with self._lock:
+            return bool(self._load())
+
+    def data(self) -> dict:
+        """
+        Returns a copy of all the values.
+        """
+        with self._lock:
+            return dict(self._load())
+
+    def get(
+        self,
+        key: str,
+        default=None,
+    ):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def update(
+        self,
+        values: dict,
+    ):
+        """
+        Changes some values and schedules a write of the file.
+        """
+        with self._lock:
+            self._load().update(values)
+            self._schedule()
+
+    def replace(
+        self,
+        values: dict,
+    ):
+        """
+        Replaces all the values and schedules a write of the file.
+        """
+        with self._lock:
+            self._data = dict(values)
+            self._schedule()
+
+    def flush(self):
+        """
+        Writes the pending updates now, if any.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            folder = os.path.dirname(self.path)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=folder,
+                prefix=".tmp_",
+                suffix=".yaml",
+            )
+            try:
+                with os.fdopen(fd, "w") as file:
+                    yaml.dump(self._data, file, default_flow_style=False)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self._dirty = False
+
+    def _load(self) -> dict:
+        if self._data is None:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as file:
+                    self._data = yaml.safe_load(file) or {}
+            else:
+                self._data = {}
+        return self._data
+
+    def _schedule(self):
+        self._dirty = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.delay, self._flush_later)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[ERROR] Could not save {self.path}: {e}")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(path: str) -> ConfigStore:
+    """
+    Returns the store of a configuration file, shared by the whole process.
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ConfigStore(path)
+        return _stores[key]
+
+
+@atexit.register
+def flush_all():
+    """
+    Writes the pending updates of every store (called at exit).
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.flush()
+        except Exception as e:
+            print(f"[ERROR] Could not save {store.path}: {e}")
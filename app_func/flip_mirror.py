@@ -1,21 +1,125 @@
 import PyDAQmx
 import numpy as np
+import threading
 import time
 from PyDAQmx import Task
 
+from app_func.app_functions import CONFIG
+from app_func.config_store import get_config_store
+
+
+class MirrorController:
+    """
+    Flip mirror driven by a digital line (0: ORCA-Flash path, 1: ORCA-Quest).
+
+    The DO task is opened once and kept, and the last written state is
+    remembered, so asking for the current position does nothing. Switching
+    does not block: the time of the switch is kept and wait_settled() only
+    waits for what remains of settle_time, e.g. at the start of a scan after
+    its setup is done.
+    """
+
+    def __init__(
+        self,
+        line: str = "Dev1/port0/line0",
+        settle_time: float = 2.0,
+    ):
+        """
+        Parameters:
+        - line: Digital line driving the mirror.
+        - settle_time: Time (s) the mirror needs to reach a new position.
+        """
+        self.line = line
+        self.settle_time = settle_time
+        self.state = None  # unknown until the first write
+        self.switched_at = None
+        self._task = None
+        self._lock = threading.Lock()
+
+    def set_state(
+        self,
+        state: int,
+    ) -> bool:
+        """
+        Moves the mirror, unless it is already in this position.
+
+        Returns:
+        - True if the mirror was switched.
+        """
+        if state not in [0, 1]:
+            raise ValueError("Mirror state should be 0 or 1")
+        with self._lock:
+            if state == self.state:
+                return False
+            if self._task is None:
+                self._open()
+            try:
+                self._task.WriteDigitalLines(
+                    1,
+                    1,
+                    10.0,
+                    PyDAQmx.DAQmx_Val_GroupByChannel,
+                    np.array([state], dtype=np.uint8),
+                    None,
+                    None,
+                )
+            except Exception:
+                # the line is in an unknown state, write again next time
+                self.state = None
+                raise
+            self.state = state
+            self.switched_at = time.perf_counter()
+            return True
+
+    def remaining_settle_time(self) -> float:
+        if self.switched_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self.switched_at
+        return max(0.0, self.settle_time - elapsed)
+
+    def wait_settled(self):
+        """
+        Blocks until the last switch had settle_time to complete.
+        """
+        time.sleep(self.remaining_settle_time())
+
+    def close(self):
+        with self._lock:
+            if self._task is not None:
+                self._task.StopTask()
+                self._task.ClearTask()
+                self._task = None
+
+    def _open(self):
+        task = Task()
+        task.CreateDOChan(self.line, "", PyDAQmx.DAQmx_Val_ChanForAllLines)
+        task.StartTask()
+        self._task = task
+
+
+_mirror = None
+
+
+def get_mirror() -> MirrorController:
+    """
+    Returns the mirror controller shared by the whole application. Its settle
+    time is read from the "mirror_settle_time" key of CONFIG.
+    """
+    global _mirror
+    if _mirror is None:
+        settle_time = get_config_store(CONFIG).get("mirror_settle_time", 2.0)
+        _mirror = MirrorController(settle_time=float(settle_time))
+    return _mirror
+
 
 def switch_mirror(state: int):
-    task = Task()
-    task.CreateDOChan("Dev1/port0/line0", "", PyDAQmx.DAQmx_Val_ChanForAllLines)
-
-    try:
-            if state==1 or state==0:
-                data = np.array([state], dtype=np.uint8)
-                task.WriteDigitalLines(1, 1, 10.0, PyDAQmx.DAQmx_Val_GroupByChannel, data, None, None)
-                time.sleep(2)
-    finally:
-        task.StopTask()
-        task.ClearTask()
+    """
+    Moves the mirror and waits until it is settled (no wait if it was already
+    in this position).
+    """
+    mirror = get_mirror()
+    mirror.set_state(state)
+    mirror.wait_settled()
 
 
 if __name__=="__main__":
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Metadata stored next to every frame of the ring buffer
+FRAME_META = np.dtype(
+    [
+        ("index", "i4", (3,)),  # (z, x, y) position in the scan grid
+        ("position", "f8", (3,)),  # stage (x, y, z) position in mm
+        ("spacing", "f8"),
+        ("timestamp", "f8"),  # time.time() when the frame was queued
+    ]
+)
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size circular store for frames waiting to be written.
+
+    The frame array and a structured metadata array (FRAME_META) are
+    allocated once, from the shape and type of the first frame, and every
+    following frame is copied into a free slot. Long scans therefore do not
+    allocate one array and one Python list per frame. The frame array can be
+    backed by a numpy.memmap file to hold more frames than fit in memory.
+
+    One producer (the acquisition loop) calls put() and one consumer (the
+    writer thread) calls get() then release() once the slot is written.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 16,
+        spill_path: str = None,
+    ):
+        """
+        Parameters:
+        - capacity: Number of frame slots.
+        - spill_path: File backing the frame array (memmap). In memory if None.
+        """
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.frames = None
+        self.meta = np.zeros(capacity, dtype=FRAME_META)
+        self._head = 0  # number of frames put
+        self._tail = 0  # number of frames released
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return self._head - self._tail
+
+    def put(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ) -> int:
+        """
+        Copies a frame and its metadata into the next slot. Blocks while the
+        buffer is full.
+
+        Returns:
+        - The slot used.
+        """
+        with self._cond:
+            while self._head - self._tail >= self.capacity and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("The frame buffer is closed")
+            slot = self._head % self.capacity
+        if self.frames is None:
+            self._allocate(img)
+        elif img.shape != self.frames.shape[1:]:
+            raise ValueError(
+                f"Frame shape {img.shape} differs from {self.frames.shape[1:]}"
+            )
+        # the slot is free, the consumer does not read it until head moves
+        self.frames[slot] = img
+        self.meta["index"][slot] = index
+        self.meta["position"][slot] = (x, y, z)
+        self.meta["spacing"][slot] = spacing
+        self.meta["timestamp"][slot] = time.time()
+        with self._cond:
+            self._head += 1
+            self._cond.notify_all()
+        return slot
+
+    def get(self):
+        """
+        Returns the slot of the oldest frame not released yet, waiting for one
+        if needed, or None once the buffer is closed and empty.
+        """
+        with self._cond:
+            while self._head == self._tail and not self._closed:
+                self._cond.wait()
+            if self._head == self._tail:
+                return None
+            return self._tail % self.capacity
+
+    def release(self):
+        """
+        Frees the slot returned by the last get().
+        """
+        with self._cond:
+            self._tail += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """
+        Stops accepting frames. get() returns the frames left, then None.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def free(self):
+        """
+        Drops the frame array and removes the memmap file, if any.
+        """
+        frames, self.frames = self.frames, None
+        if isinstance(frames, np.memmap):
+            frames._mmap.close()
+            del frames
+            os.remove(self.spill_path)
+
+    def _allocate(self, img):
+        shape = (self.capacity,) + img.shape
+        if self.spill_path is None:
+            self.frames = np.empty(shape, dtype=img.dtype)
+        else:
+            self.frames = np.memmap(
+                self.spill_path,
+                dtype=img.dtype,
+                mode="w+",
+                shape=shape,
+            )
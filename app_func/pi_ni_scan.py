@@ -1,10 +1,4 @@
 import numpy as np
-from tifffile import (
-    tifffile,
-)
-from ome_types import (
-    from_xml,
-)
 from pi_contol.PiController import (
     PiController,
 )
@@ -20,13 +14,48 @@ from pipython import (
     PILogger,
 )
 import logging
-from skimage.io import (
-    imsave,
-)
 from napari.qt.threading import (
     thread_worker,
 )
 import os
+from concurrent.futures import (
+    wait,
+)
+from contextlib import (
+    closing,
+)
+from app_func.scan_writer import (
+    ScanWriter,
+    save_image,
+)
+from galvo.galvo_output import (
+    get_galvo_output,
+)
+from app_func.flip_mirror import (
+    get_mirror,
+)
+from app_func.checkpoint import (
+    ScanCheckpoint,
+)
+from app_func.spill import (
+    SPILL_NAME,
+    recover,
+)
+from app_func.scan_progress import (
+    STOP,
+    ScanProgress,
+)
+from app_func.scan_plan import (
+    ScanPlan,
+)
+from app_func.camera_sequence import (
+    EXTERNAL_TRIGGER,
+    SequenceDrain,
+    camera_pulse_train_task,
+    camera_trigger_task,
+    fire_trigger,
+    set_camera_trigger,
+)
 
 
 
@@ -66,6 +95,8 @@ def scan(
     sample_number_per_sine_period: int,
     path: str,
     duration: float = 2,
+    file_format: str = "plane",
+    mode: str = "snap",
 ):
     """
     Performs a Z-axis scan while sending a sinusoidal signal to the galvo (Y-axis).
@@ -81,8 +112,19 @@ def scan(
     - frequency: Frequency of the sinusoidal wave used to modulate the galvo.
     - sample_number_per_sine_period: Number of samples per sine wave period.
     - duration: Duration of the scan in seconds (default is 120).
+    - file_format: Output format, one of scan_writer.FILE_FORMATS. Planes are
+      stored along the Z axis of the scan grid.
+    - mode: "snap" snaps each plane in software, "sequenced" runs a camera
+      sequence acquisition triggered by the NI counter (see sequenced_planes),
+      "continuous" sweeps Z once at constant velocity (see continuous_planes).
+
+    Yields a ScanProgress dict after each plane. The worker can be paused
+    (worker.pause()) or stopped (worker.send(STOP)) between two planes, except
+    during a continuous sweep. Returns True if every plane was acquired.
     """
 
+    # free ao0/ao1 from the static galvo output for the hardware-timed task
+    get_galvo_output().release()
     taskG = Task()
     taskG.CreateAOVoltageChan(
         "Dev1/ao1",
@@ -151,49 +193,241 @@ def scan(
         None,
     )
 
-    axe = 1
-    pi_controller.devices[device_id - 1].gcscommands.VEL(
-        axe,
+    pi_controller.set_velocity(
+        device_id,
         1.5,
     )
-
-    pi_controller.devices[device_id - 1].gcscommands.MOV(
-        axe,
+    pi_controller.move_abs(
+        device_id,
         startZ,
     )
-    while not pi_controller.devices[device_id - 1].gcscommands.qONT(axe)[axe]:
-        time.sleep(0.05)
-    # print(pi_controller.devices[device_id-1].gcscommands.qONT(axe)[axe])
     planes = np.linspace(
         startZ,
         stopZ,
         plane_number,
     )
 
-    images = []
+    # X and Y stages do not move during the fast scan
+    x_pos = pi_controller.get_pos(3, max_age=1.0)
+    y_pos = pi_controller.get_pos(4, max_age=1.0)
+    writer = ScanWriter(
+        path,
+        file_format=file_format,
+        shape=(plane_number, 1, 1),
+    )
+    writer.start()
+    # the mirror switched by the widget had the setup time to settle
+    get_mirror().wait_settled()
     taskG.StartTask()
     task_ms.StartTask()
 
-    for i in range(plane_number):
-        pi_controller.devices[device_id - 1].gcscommands.MOV(
-            axe,
-            planes[i],
+    spacing = abs(stopZ - startZ) / max(plane_number - 1, 1)
+
+    def put_plane(i, im, z=None):
+        writer.put(
+            (i, 0, 0),
+            x_pos,
+            y_pos,
+            planes[i] if z is None else z,
+            im,
+            spacing,
         )
-        while not pi_controller.devices[device_id - 1].gcscommands.qONT(axe)[axe]:
-            time.sleep(0.05)
-        im = core.snap(fix=True)
-        images.append(im)
 
-    taskG.StopTask()
-    task_ms.StopTask()
-    taskG.ClearTask()
-    task_ms.ClearTask()
+    progress = ScanProgress(plane_number)
+    try:
+        if mode == "continuous":
+            continuous_planes(
+                pi_controller,
+                core,
+                device_id,
+                planes,
+                frequency,
+                put_plane,
+            )
+            yield progress.update(plane_number)
+        elif mode == "sequenced":
+            with closing(
+                sequenced_planes(
+                    pi_controller,
+                    core,
+                    device_id,
+                    planes,
+                    put_plane,
+                )
+            ) as acquired:
+                for n in acquired:
+                    if (yield progress.update(n)) == STOP:
+                        return False
+        else:
+            for i in range(plane_number):
+                pi_controller.move_abs(
+                    device_id,
+                    planes[i],
+                )
+                im = core.snap(fix=True)
+                put_plane(i, im)
+                if (yield progress.update(i + 1)) == STOP:
+                    return False
+    finally:
+        taskG.StopTask()
+        task_ms.StopTask()
+        taskG.ClearTask()
+        task_ms.ClearTask()
+        writer.close()
+    return True
+
+
+def sequenced_planes(
+    pi_controller: PiController,
+    core: CMMCorePlus,
+    device_id: int,
+    planes,
+    put_plane,
+):
+    """
+    Acquires one frame per Z plane with a hardware-sequenced camera.
 
-    for i in range(len(images)):
-        s = path + "/" + str(i) + ".tif"
-        imsave(
-            s,
-            images[i],
+    The camera runs a sequence acquisition in external trigger mode and each
+    frame is triggered by a single pulse of the NI counter (/Dev1/ctr1, armed
+    on the PFI12 galvo clock) once the stage is on target. Frames are pulled
+    from the circular buffer by a drain thread, so readout and saving overlap
+    with the next stage move instead of paying a full snap() per plane.
+
+    This is a generator yielding the number of planes triggered after each
+    plane. Closing it stops the sequence acquisition.
+
+    Parameters:
+    - pi_controller: PI controller instance.
+    - core: Micro-Manager core object for image acquisition.
+    - device_id: Index of the PI device moving the Z axis (1-based).
+    - planes: Z positions of the planes.
+    - put_plane: Callable receiving (plane index, image) for each frame.
+    """
+    exposure = core.getExposure() / 1000
+    drain = SequenceDrain(
+        core,
+        len(planes),
+        lambda i, im, metadata: put_plane(i, im),
+    )
+    previous = set_camera_trigger(core, EXTERNAL_TRIGGER)
+    trigger = camera_trigger_task()
+    core.startSequenceAcquisition(len(planes), 0, True)
+    drain.start()
+    try:
+        for i in range(len(planes)):
+            pi_controller.move_abs(
+                device_id,
+                planes[i],
+            )
+            fire_trigger(trigger)
+            # the stage must stay still until the exposure is over
+            time.sleep(exposure)
+            yield i + 1
+        if not drain.wait():
+            print(f"[ERROR] Only {drain.received}/{len(planes)} frames received")
+    finally:
+        drain.stop()
+        core.stopSequenceAcquisition()
+        trigger.ClearTask()
+        set_camera_trigger(core, previous)
+
+
+def continuous_planes(
+    pi_controller: PiController,
+    core: CMMCorePlus,
+    device_id: int,
+    planes,
+    frame_rate: float,
+    put_plane,
+    max_velocity: float = 1.5,
+    sample_period: float = 0.005,
+):
+    """
+    Acquires the Z planes during a single constant-velocity sweep of the stage.
+
+    The stage starts at planes[0] and travels once to planes[-1] at a velocity
+    of plane spacing * frame rate, while the NI counter emits one camera trigger
+    per plane spacing. The stage position is sampled with qPOS during the sweep
+    and the Z of each frame is interpolated at its trigger time, so frames taken
+    while the stage accelerates or decelerates get their real position.
+
+    Parameters:
+    - pi_controller: PI controller instance.
+    - core: Micro-Manager core object for image acquisition.
+    - device_id: Index of the PI device moving the Z axis (1-based).
+    - planes: Z positions of the planes; only the range and count are used.
+    - frame_rate: Requested camera frame rate, in Hz. Lowered if the stage
+      would have to exceed max_velocity.
+    - put_plane: Callable receiving (plane index, image, z) for each frame.
+    - max_velocity: Maximum stage velocity, in mm/s.
+    - sample_period: Interval between two position samples, in s. Keeps the
+      daisy chain free for the other queries during the sweep.
+    """
+    count = len(planes)
+    spacing = abs(planes[-1] - planes[0]) / max(count - 1, 1)
+    velocity = spacing * frame_rate
+    if velocity > max_velocity:
+        velocity = max_velocity
+        frame_rate = velocity / spacing
+    if core.getExposure() / 1000 > 1 / frame_rate:
+        print("[ERROR] Exposure is longer than the frame period")
+
+    # (time, position) samples of the stage during the sweep
+    samples = [(time.perf_counter(), planes[0])]
+    direction = 1 if planes[-1] >= planes[0] else -1
+    low, high = min(planes[0], planes[-1]), max(planes[0], planes[-1])
+    trigger_start = [None]
+
+    def frame_z(i):
+        t = trigger_start[0] + i / frame_rate
+        times, positions = zip(*list(samples))
+        if t > times[-1] and len(times) > 1 and positions[-1] != planes[-1]:
+            # frame taken after the last sample: extrapolate at sweep velocity
+            z = positions[-1] + direction * velocity * (t - times[-1])
+            return float(np.clip(z, low, high))
+        return float(np.interp(t, times, positions))
+
+    drain = SequenceDrain(
+        core,
+        count,
+        lambda i, im, metadata: put_plane(i, im, frame_z(i)),
+    )
+    previous = set_camera_trigger(core, EXTERNAL_TRIGGER)
+    trigger = camera_pulse_train_task(frame_rate, count)
+    core.startSequenceAcquisition(count, 0, True)
+    try:
+        pi_controller.set_velocity(
+            device_id,
+            velocity,
+        )
+        # the sweep velocity sets the plane spacing, not the motion profile
+        pi_controller.start_move(
+            device_id,
+            planes[-1],
+            use_profile=False,
+        )
+        trigger_start[0] = time.perf_counter()
+        trigger.StartTask()
+        drain.start()
+        while True:
+            t = time.perf_counter()
+            position = pi_controller.get_pos(device_id)
+            samples.append(((t + time.perf_counter()) / 2, position))
+            if pi_controller.is_on_target(device_id):
+                break
+            time.sleep(max(0.0, sample_period - (time.perf_counter() - t)))
+        trigger.WaitUntilTaskDone(count / frame_rate + 5)
+        if not drain.wait():
+            print(f"[ERROR] Only {drain.received}/{count} frames received")
+    finally:
+        drain.stop()
+        core.stopSequenceAcquisition()
+        trigger.StopTask()
+        trigger.ClearTask()
+        set_camera_trigger(core, previous)
+        pi_controller.set_velocity(
+            device_id,
+            max_velocity,
         )
 
 
@@ -225,7 +459,6 @@ def sync_scan(
     - plane_number: Number of Z-slices (planes).
     """
 
-    axe = 1
     # a changer -----------------------------------------
     step_cam = 1 / (2 * frequency)
     taskCAM = Task()
@@ -247,6 +480,7 @@ def sync_scan(
         PyDAQmx.DAQmx_Val_Rising,
     )
     # --------------------------------------------------------
+    get_galvo_output().release()
     taskG = Task()
     taskG.CreateAOVoltageChan(
         "Dev1/ao1",
@@ -270,12 +504,10 @@ def sync_scan(
     images = []
 
     for i in range(plane_number):
-        pi_controller.devices[device_id - 1].gcscommands.MOV(
-            axe,
+        pi_controller.move_abs(
+            device_id,
             dataPI[i],
         )
-        while not pi_controller.devices[device_id - 1].gcscommands.qONT(axe)[axe]:
-            time.sleep(0.05)
 
         for j in range(plane_size):
             taskG.WriteAnalogF64(
@@ -297,6 +529,8 @@ def sync_scan(
 
     taskCAM.ClearTask()
 
+    from skimage.io import imsave
+
     for i in range(len(images)):
         s = "TEST/" + str(i + 1) + ".tif"
         imsave(
@@ -305,6 +539,37 @@ def sync_scan(
         )
 
 
+# PI devices (1-based) moving the Z, X and Y axes of a Brillouin scan
+ZXY_DEVICES = (1, 3, 4)
+
+# Camera ROI (x, y, width, height) of a Brillouin scan
+BRILLOUIN_ROI = (0, 0, 1000, 1000)
+
+
+def issue_moves(
+    pi_controller: PiController,
+    target,
+    commanded,
+):
+    """
+    Moves the Z, X and Y controllers whose target changed, all at once.
+
+    Parameters:
+    - pi_controller: PI controller instance.
+    - target: (z, x, y) position to reach.
+    - commanded: Last (z, x, y) targets sent, updated in place.
+
+    Returns:
+    - Future: Resolved when every moved axis is on target.
+    """
+    moves = {}
+    for axis, device_id in enumerate(ZXY_DEVICES):
+        if commanded[axis] != target[axis]:
+            moves[device_id] = target[axis]
+            commanded[axis] = target[axis]
+    return pi_controller.move_many(moves)
+
+
 @thread_worker
 def brillouin_scan(
     pi_controller: PiController,
@@ -319,9 +584,24 @@ def brillouin_scan(
     step_y,
     step_z,
     path,
+    file_format="voxel",
+    resume=False,
+    order="snake",
 ):
     """
-    Executes a full 3D Brillouin scan using serpentine scanning pattern.
+    Executes a full 3D Brillouin scan following a ScanPlan (boustrophedon
+    order over Y, X and Z by default). Raises ValueError if a voxel is out of
+    the stage limits.
+
+    The progress is checkpointed in the output folder (see ScanCheckpoint).
+    With resume=True, the scan continues an interrupted one with the same
+    parameters: frames left in its spill file are saved first, then only the
+    voxels not saved yet are acquired.
+
+    Yields a ScanProgress dict after each voxel. The worker can be paused
+    (worker.pause()) or stopped (worker.send(STOP)) between two voxels; the
+    stages then end on target and the scan can be resumed later. Returns True
+    if every voxel was acquired.
 
     Parameters:
     - pi_controller: Controller instance for PI XYZ stages.
@@ -330,155 +610,114 @@ def brillouin_scan(
     - end_point_x/y/z: Ending positions for each axis.
     - step_x/y/z: Step size for each axis (in micrometers, will be converted to mm internally).
     - path: Directory path where acquired OME-TIFF images will be saved.
+    - file_format: "voxel" for one OME-TIFF per voxel, "ome-stack" for a single
+      BigTIFF holding the whole scan, "ome-zarr" for a chunked OME-Zarr.
+    - resume: Continue the interrupted scan saved in path.
+    - order: Voxel order, one of scan_plan.ORDERS.
     """
-
-    axe = 1
-    step_z = step_x / 1000
-    step_x = step_x / 1000
-    step_y = step_y / 1000
-    pi_controller.devices[0].gcscommands.VEL(
-        axe,
-        1.5,
-    )  # z
-    pi_controller.devices[2].gcscommands.VEL(
-        axe,
-        1.5,
-    )  # x
-    pi_controller.devices[3].gcscommands.VEL(
-        axe,
-        1.5,
-    )  # y
-
-    num_z_values = int(abs((end_point_z - starting_point_z) // step_z)) + 1
-    num_x_values = int(abs((end_point_x - starting_point_x) // step_x)) + 1
-    num_y_values = int(abs((end_point_y - starting_point_y) // step_y)) + 1
-
-    # print(num_z_values,num_x_values,num_y_values)
-
-    dataPI_z = np.linspace(
-        starting_point_z,
-        end_point_z,
-        num_z_values,
-    )
-    dataPI_x = np.linspace(
-        starting_point_x,
-        end_point_x,
-        num_x_values,
+    params = {
+        "start": [starting_point_x, starting_point_y, starting_point_z],
+        "end": [end_point_x, end_point_y, end_point_z],
+        "step": [step_x, step_y, step_z],
+        "file_format": file_format,
+        "order": order,
+    }
+
+    plan = ScanPlan(
+        (starting_point_x, starting_point_y, starting_point_z),
+        (end_point_x, end_point_y, end_point_z),
+        (step_x, step_y, step_z),
+        order=order,
     )
-    dataPI_y = np.linspace(
-        starting_point_y,
-        end_point_y,
-        num_y_values,
-    )
-
-    core.setROI(
-        0,
-        0,
-        1000,
-        1000,
-    )
-
-    # print(dataPI_z,dataPI_x,dataPI_y)
-
-    images = []
-
-    pi_controller.devices[0].gcscommands.MOV(
-        axe,
-        starting_point_z,
-    )
-    pi_controller.devices[2].gcscommands.MOV(
-        axe,
-        starting_point_x,
-    )
-    pi_controller.devices[3].gcscommands.MOV(
-        axe,
-        starting_point_y,
-    )
-
-    while not pi_controller.devices[0].gcscommands.qONT(axe)[axe]:
-        time.sleep(0.005)
-    while not pi_controller.devices[2].gcscommands.qONT(axe)[axe]:
-        time.sleep(0.005)
-    while not pi_controller.devices[3].gcscommands.qONT(axe)[axe]:
-        time.sleep(0.005)
-
-    for i in range(num_z_values):
-        # if i!=0 :
-        # move_z = 0.9 * (dataPI_z[i] - dataPI_z[i-1]) + dataPI_z[i-1]
-        # pi_controller.devices[0].gcscommands.MOV(axe, move_z)
-        # else:
-        pi_controller.devices[0].gcscommands.MOV(
-            axe,
-            dataPI_z[i],
-        )
-
-        # print("Z",pi_controller.devices[0].gcscommands.qPOS(axe))
-
-        for j in range(num_x_values):
-            #    if j!=0:
-            #        move_x = 0.9 * (dataPI_x[j] - dataPI_x[j-1]) + dataPI_x[j-1]
-            #        pi_controller.devices[2].gcscommands.MOV(axe, move_x)
-            #    else:
-            pi_controller.devices[2].gcscommands.MOV(
-                axe,
-                dataPI_x[j],
+    errors = plan.validate()
+    if errors:
+        raise ValueError("; ".join(errors))
+    step_z = plan.steps[0]
+
+    if pi_controller.motion_profile is None:
+        for device_id in ZXY_DEVICES:
+            pi_controller.set_velocity(
+                device_id,
+                1.5,
             )
-
-            # print("X",pi_controller.devices[2].gcscommands.qPOS(axe))
-
-            for k in range(num_y_values):
-
-                # if k!=0:
-                #    move_y = 0.9 * (dataPI_y[k] - dataPI_y[k-1]) + dataPI_y[k-1]
-                #    pi_controller.devices[3].gcscommands.MOV(axe, move_y)
-                # else:
-                if j % 2 == 0:
-                    pi_controller.devices[3].gcscommands.MOV(
-                        axe,
-                        dataPI_y[k],
-                    )
-                else:
-                    pi_controller.devices[3].gcscommands.MOV(
-                        axe,
-                        dataPI_y[num_y_values - 1 - k],
-                    )
-
-                while not pi_controller.devices[3].gcscommands.qONT(axe)[axe]:
-                    time.sleep(0.005)
-                if k == 0:
-                    while not pi_controller.devices[0].gcscommands.qONT(axe)[axe]:
-                        time.sleep(0.005)
-                    while not pi_controller.devices[2].gcscommands.qONT(axe)[axe]:
-                        time.sleep(0.005)
-
-                # print("Y", pi_controller.devices[3].gcscommands.qPOS(axe))
-
-                im = core.snap(fix=True)
-                if j % 2 == 0:
-                    images.append(
-                        [
-                            dataPI_x[j],
-                            dataPI_y[k],
-                            dataPI_z[i],
-                            im,
-                            step_z,
-                        ]
-                    )
-                else:
-                    images.append(
-                        [
-                            dataPI_x[j],
-                            dataPI_y[num_y_values - 1 - k],
-                            dataPI_z[i],
-                            im,
-                            step_z,
-                        ]
-                    )
-
-    save_images(
-        images,
+    # otherwise the velocity of each move is set by the motion profile
+
+    core.setROI(*BRILLOUIN_ROI)
+
+    shape = plan.shape
+    indices, positions = plan.indices, plan.positions
+    # trajectory index of every voxel, recorded in the checkpoint
+    order = np.empty(shape, dtype=int)
+    order[indices[:, 0], indices[:, 1], indices[:, 2]] = np.arange(len(indices))
+
+    checkpoint = ScanCheckpoint(path)
+
+    def voxel_saved(index):
+        checkpoint.mark_done(index, int(order[index]))
+
+    if resume:
+        checkpoint.load(params)
+        spill_path = os.path.join(path, SPILL_NAME)
+        if os.path.exists(spill_path):
+            # frames acquired before the interruption but maybe not saved
+            recover(spill_path, path, file_format, on_written=voxel_saved)
+            os.remove(spill_path)
+        remaining = checkpoint.remaining(indices)
+        indices = indices[remaining]
+        positions = positions[remaining]
+    else:
+        if not os.path.exists(path):
+            os.makedirs(path)
+        checkpoint.start(params, shape)
+
+    # frames are written as soon as they are acquired
+    writer = ScanWriter(
         path,
+        file_format=file_format,
+        shape=shape,
+        spill=True,  # kept for recovery if the scan is interrupted
+        resume=resume,
+        on_written=voxel_saved,
     )
+    writer.start()
+
+    # the mirror switched by the widget had the setup time to settle
+    get_mirror().wait_settled()
+
+    progress = ScanProgress(len(positions))
+    moving = None
+    try:
+        # Look-ahead pipeline: once the exposure of a voxel is over, the moves
+        # towards the next voxel are issued on every controller that has to
+        # move, and the camera readout happens while the stages travel.
+        commanded = [None, None, None]
+        if len(positions):
+            moving = issue_moves(pi_controller, positions[0], commanded)
+        for n in range(len(positions)):
+            moving.result()
+            core.snapImage()  # returns when the exposure is over
+            if n + 1 < len(positions):
+                moving = issue_moves(pi_controller, positions[n + 1], commanded)
+            im = core.getImage(fix=True)
+            writer.put(
+                tuple(indices[n]),
+                positions[n][1],
+                positions[n][2],
+                positions[n][0],
+                im,
+                step_z,
+            )
+            if (yield progress.update(n + 1)) == STOP:
+                return False
+    finally:
+        try:
+            if moving is not None:
+                # leave the stages on target, not in the middle of a move
+                wait([moving])
+            writer.close()
+        finally:
+            checkpoint.save(finished=not checkpoint.remaining(indices).any())
+    return True
 
 
 def save_images(
@@ -496,36 +735,13 @@ def save_images(
     if not os.path.exists(path):
         os.makedirs(path)
     for i in range(len(images)):
-        x_pos = int(images[i][0] * 1e3)
-        y_pos = int(images[i][1] * 1e3)
-        z_pos = int(images[i][2] * 1e3)
-        img = images[i][3]
-        spacing = images[i][4]
-        tifffile.imwrite(
-            path
-            + "/"
-            + "Z"
-            + str(z_pos)
-            + "_X"
-            + str(x_pos)
-            + "_Y"
-            + str(y_pos)
-            + ".ome.tif",
-            img,
-            ome=True,
-            metadata={
-                "axes": "YX",
-                "spacing": spacing,
-                "unit": "µm",
-                "Plane": {
-                    "PositionX": x_pos,
-                    "PositionY": y_pos,
-                    "PositionZ": z_pos,
-                    "PositionXUnit": "µm",
-                    "PositionYUnit": "µm",
-                    "PositionZUnit": "µm",
-                },
-            },
+        save_image(
+            images[i][0],
+            images[i][1],
+            images[i][2],
+            images[i][3],
+            images[i][4],
+            path,
         )
 
 
@@ -535,12 +751,18 @@ def read_tiff_img(
     """
     Reads a TIFF image file and extracts its OME metadata.
 
+    Works for single voxel files as well as "ome-stack" files, in which case
+    the image data has one frame per voxel and metadata.pixels.planes holds
+    the position of each of them.
+
     Parameters:
     - img: Path to the TIFF file.
 
     Returns:
     - Tuple of (OME metadata as parsed object, image data as numpy array).
     """
+    from tifffile import tifffile
+    from ome_types import from_xml
 
     with tifffile.TiffFile(img) as tif:
         image_data = tif.asarray()
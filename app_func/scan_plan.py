@@ -0,0 +1,425 @@
+import argparse
+
+import numpy as np
+
+from app_func.app_functions import PI_LIMITS
+
+# Travel range (mm) of the stages moving each axis of a Brillouin scan
+STAGE_LIMITS = {
+    "z": PI_LIMITS[1],
+    "x": PI_LIMITS[3],
+    "y": PI_LIMITS[4],
+}
+
+# Order of the axes in the indices and positions arrays of a plan
+AXES = ("z", "x", "y")
+
+
+def axis_positions(
+    start: float,
+    end: float,
+    step: float,
+):
+    """
+    Returns the positions from start towards end, exactly `step` apart.
+
+    end is included when the range is a multiple of step. A null step or
+    range gives the start position only.
+    """
+    extent = abs(end - start)
+    if step <= 0 or extent == 0:
+        return np.array([float(start)])
+    # the tolerance keeps end when extent / step is an integer
+    num = int(np.floor(extent / step + 1e-9)) + 1
+    return start + np.sign(end - start) * step * np.arange(num)
+
+
+def legacy_order(shape):
+    """
+    Returns the (N, 3) grid indices of the historical scan order, in (z, x, y).
+
+    Y is reversed on odd X columns only: X flies back to its first column at
+    every new layer.
+    """
+    nz, nx, ny = shape
+    iz, ix, iy = np.meshgrid(
+        np.arange(nz),
+        np.arange(nx),
+        np.arange(ny),
+        indexing="ij",
+    )
+    iy = np.where(ix % 2 == 1, ny - 1 - iy, iy)
+    return np.stack((iz.ravel(), ix.ravel(), iy.ravel()), axis=1)
+
+
+def snake_order(shape):
+    """
+    Returns the (N, 3) grid indices of a boustrophedon scan, in (z, x, y).
+
+    Y is reversed on every other line and X on every other layer, so two
+    consecutive voxels are always neighbours: no axis ever flies back.
+    """
+    nz, nx, ny = shape
+    iz, ix, iy = np.meshgrid(
+        np.arange(nz),
+        np.arange(nx),
+        np.arange(ny),
+        indexing="ij",
+    )
+    ix = np.where(iz % 2 == 1, nx - 1 - ix, ix)
+    # Y lines are counted over the whole scan, so that Y also keeps going
+    # the same way across a layer change
+    line = iz * nx + np.arange(nx)[None, :, None]
+    iy = np.where(line % 2 == 1, ny - 1 - iy, iy)
+    return np.stack((iz.ravel(), ix.ravel(), iy.ravel()), axis=1)
+
+
+# Largest point set ordered by nearest_order (O(N^2), about 0.5 s)
+NEAREST_MAX_POINTS = 5000
+
+
+def nearest_order(
+    points,
+    start: int = 0,
+    velocity=1.0,
+):
+    """
+    Orders an arbitrary point set by always going to the closest remaining
+    point. On a regular grid, snake_order is shorter: use this one for
+    irregular point sets only.
+
+    The axes move at the same time, so the cost of a move is the time of its
+    slowest axis: max(|delta| / velocity) over the axes. This greedy order is
+    O(N^2), so it refuses more than NEAREST_MAX_POINTS points.
+
+    Parameters:
+    - points: (N, D) positions.
+    - start: Index of the first point.
+    - velocity: Velocity of each axis (scalar or D values).
+
+    Returns:
+    - Permutation of range(N), in visiting order.
+    """
+    if len(points) > NEAREST_MAX_POINTS:
+        raise ValueError(
+            f"{len(points)} points, nearest_order is limited to "
+            f"{NEAREST_MAX_POINTS}"
+        )
+    scaled = np.asarray(points, dtype=float) / np.asarray(velocity, dtype=float)
+    n = len(scaled)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    current = start
+    for k in range(n):
+        order[k] = current
+        visited[current] = True
+        if k == n - 1:
+            break
+        cost = np.abs(scaled - scaled[current]).max(axis=1)
+        cost[visited] = np.inf
+        current = int(np.argmin(cost))
+    return order
+
+
+# Voxel orders of a Brillouin scan grid
+ORDERS = ("snake", "legacy")
+
+
+def move_times(
+    positions,
+    velocity: float = 1.5,
+    move_overhead: float = 0.02,
+    motion_profile=None,
+    devices=None,
+):
+    """
+    Returns the duration (s) of each move of a trajectory, set by its slowest
+    axis since the axes move at the same time.
+
+    With a motion_profile and the controller index of each axis (devices),
+    the calibrated move+settle times are used for the calibrated axes. Axes
+    with no calibrated row keep the velocity estimate.
+    """
+    steps = np.abs(np.diff(positions, axis=0))
+    move = np.where(steps > 0, steps / velocity + move_overhead, 0.0)
+    if motion_profile is not None and devices is not None:
+        for axis, device_id in enumerate(devices):
+            if not motion_profile.table.get(device_id):
+                continue
+            # a scan has few distinct move sizes
+            sizes, inverse = np.unique(steps[:, axis], return_inverse=True)
+            times = np.array(
+                [
+                    motion_profile.predict(device_id, size)
+                    for size in sizes
+                ],
+                dtype=float,
+            )[inverse]
+            # None becomes nan: keep the velocity estimate for those sizes
+            move[:, axis] = np.where(np.isnan(times), move[:, axis], times)
+    return move.max(axis=1, initial=0.0)
+
+
+def travel_report(
+    positions,
+    velocity: float = 1.5,
+    move_overhead: float = 0.02,
+    motion_profile=None,
+    devices=None,
+) -> dict:
+    """
+    Travel of the stages along a trajectory.
+
+    Parameters:
+    - positions: (N, 3) positions in visiting order, in mm.
+    - velocity: Stage velocity, in mm/s.
+    - move_overhead: Fixed cost of a move (commands, on-target check), in s.
+    - motion_profile, devices: Calibrated move times, see move_times.
+
+    Returns:
+    - dict with "travel" (mm per axis), "longest" (longest move, mm) and
+      "time" (s spent moving, the axes moving at the same time).
+    """
+    steps = np.abs(np.diff(positions, axis=0))
+    return {
+        "travel": steps.sum(axis=0),
+        "longest": steps.max(initial=0.0),
+        "time": move_times(
+            positions,
+            velocity,
+            move_overhead,
+            motion_profile,
+            devices,
+        ).sum(),
+    }
+
+
+def compare_point_orders(
+    points,
+    start: int = 0,
+    velocity: float = 1.5,
+    move_overhead: float = 0.02,
+    motion_profile=None,
+    devices=None,
+) -> dict:
+    """
+    Returns the travel_report of an irregular point set in the given order
+    ("given") and in nearest_order ("nearest").
+
+    Parameters:
+    - points: (N, 3) positions in (z, x, y) order, in mm.
+    - start: Index of the first point of the nearest order.
+    - velocity, move_overhead, motion_profile, devices: See travel_report.
+    """
+    points = np.asarray(points, dtype=float)
+    orders = {
+        "given": np.arange(len(points)),
+        "nearest": nearest_order(points, start, velocity),
+    }
+    return {
+        name: travel_report(
+            points[order],
+            velocity,
+            move_overhead,
+            motion_profile,
+            devices,
+        )
+        for name, order in orders.items()
+    }
+
+
+class ScanPlan:
+    """
+    Ordered voxels of a Brillouin scan, computed once as numpy arrays.
+
+    indices is the (N, 3) grid index and positions the (N, 3) stage position
+    (mm) of every voxel, in acquisition order, both in (z, x, y) order. The
+    order is one of ORDERS: "snake" (boustrophedon over Y, X and Z, default)
+    or "legacy" (Y reversed on odd X columns only).
+    """
+
+    def __init__(
+        self,
+        start,
+        end,
+        step_um,
+        order: str = "snake",
+    ):
+        """
+        Parameters:
+        - start: (x, y, z) first corner of the scan, in mm.
+        - end: (x, y, z) opposite corner of the scan, in mm.
+        - step_um: (x, y, z) step of each axis, in µm.
+        - order: Voxel order, one of ORDERS.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown scan order: {order}")
+        self.order = order
+        start_x, start_y, start_z = start
+        end_x, end_y, end_z = end
+        step_x, step_y, step_z = (s / 1000 for s in step_um)
+        self.steps = (step_z, step_x, step_y)  # mm, in (z, x, y) order
+        self.axes = (
+            axis_positions(start_z, end_z, step_z),
+            axis_positions(start_x, end_x, step_x),
+            axis_positions(start_y, end_y, step_y),
+        )
+        self.shape = tuple(len(a) for a in self.axes)
+        self.indices = self._ordered_indices(order)
+        self.positions = self._positions(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _ordered_indices(
+        self,
+        order: str,
+    ):
+        if order == "legacy":
+            return legacy_order(self.shape)
+        return snake_order(self.shape)
+
+    def _positions(
+        self,
+        indices,
+    ):
+        return np.stack(
+            [axis[indices[:, i]] for i, axis in enumerate(self.axes)],
+            axis=1,
+        )
+
+    def compare_orders(
+        self,
+        orders=ORDERS,
+        velocity: float = 1.5,
+        move_overhead: float = 0.02,
+        motion_profile=None,
+        devices=None,
+    ) -> dict:
+        """
+        Returns the travel_report of this scan for each order.
+        """
+        reports = {}
+        for order in orders:
+            indices = (
+                self.indices
+                if order == self.order
+                else self._ordered_indices(order)
+            )
+            reports[order] = travel_report(
+                self._positions(indices),
+                velocity,
+                move_overhead,
+                motion_profile,
+                devices,
+            )
+        return reports
+
+    def validate(
+        self,
+        limits: dict = STAGE_LIMITS,
+    ):
+        """
+        Checks every voxel against the stage limits.
+
+        Returns:
+        - List of error messages, empty if the whole scan is reachable.
+        """
+        low = np.array([limits[axis][0] for axis in AXES])
+        high = np.array([limits[axis][1] for axis in AXES])
+        outside = (self.positions < low) | (self.positions > high)
+        errors = []
+        for i in np.flatnonzero(outside.any(axis=0)):
+            values = self.positions[:, i]
+            errors.append(
+                f"{AXES[i].upper()} goes from {values.min():.3f} to "
+                f"{values.max():.3f} mm, outside [{low[i]}, {high[i]}]"
+            )
+        return errors
+
+    def estimate(
+        self,
+        exposure: float,
+        frame_bytes: int,
+        velocity: float = 1.5,
+        move_overhead: float = 0.02,
+        readout: float = 0.0,
+        motion_profile=None,
+        devices=None,
+    ) -> dict:
+        """
+        Predicts the duration and size of the scan.
+
+        The moves towards a voxel overlap with the readout of the previous
+        frame (look-ahead pipeline of brillouin_scan), and every axis moves at
+        the same time, so each voxel costs its exposure plus the longest of
+        the readout and the slowest axis move.
+
+        Parameters:
+        - exposure: Camera exposure, in s.
+        - frame_bytes: Size of one frame, in bytes.
+        - velocity: Stage velocity, in mm/s.
+        - move_overhead: Fixed cost of a move (commands, on-target check), in s.
+        - readout: Camera readout time, in s.
+        - motion_profile: MotionProfile with the calibrated move times of the
+          stages, used instead of velocity and move_overhead.
+        - devices: Controller index of the Z, X and Y stages.
+
+        Returns:
+        - dict with "frames", "duration" (s), "bytes" and "travel" (mm per
+          axis, in (z, x, y) order).
+        """
+        moves = move_times(
+            self.positions,
+            velocity,
+            move_overhead,
+            motion_profile,
+            devices,
+        )
+        transitions = np.maximum(moves, readout)
+        return {
+            "frames": len(self),
+            "duration": len(self) * exposure + readout + transitions.sum(),
+            "bytes": len(self) * frame_bytes,
+            "travel": np.abs(np.diff(self.positions, axis=0)).sum(axis=0),
+        }
+
+
+def _print_reports(reports: dict) -> None:
+    for order, report in reports.items():
+        z, x, y = report["travel"]
+        print(
+            f"{order:>8}: travel Z {z:.3f} / X {x:.3f} / Y {y:.3f} mm, "
+            f"longest move {report['longest']:.3f} mm, "
+            f"moving {report['time']:.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    # python -m app_func.scan_plan x0 y0 z0 x1 y1 z1 step_x step_y step_z
+    # python -m app_func.scan_plan --points points.txt
+    parser = argparse.ArgumentParser(
+        description="Compare the stage travel of the scan orders."
+    )
+    parser.add_argument(
+        "grid",
+        nargs="*",
+        type=float,
+        help="x0 y0 z0 x1 y1 z1 (mm) and step_x step_y step_z (µm)",
+    )
+    parser.add_argument(
+        "--points",
+        help="Text file of irregular points, one 'x y z' line (mm) each",
+    )
+    args = parser.parse_args()
+    if args.points:
+        # (x, y, z) columns to (z, x, y) order
+        points = np.loadtxt(args.points, ndmin=2)[:, [2, 0, 1]]
+        print(f"{len(points)} points")
+        _print_reports(compare_point_orders(points))
+    elif len(args.grid) == 9:
+        plan = ScanPlan(args.grid[0:3], args.grid[3:6], args.grid[6:9])
+        print(f"{len(plan)} voxels, grid (Z, X, Y) = {plan.shape}")
+        _print_reports(plan.compare_orders())
+    else:
+        parser.error("give 9 grid values or --points")
@@ -0,0 +1,67 @@
+import time
+from collections import deque
+
+# Value sent to a scan worker (worker.send(STOP)) to stop it at the next
+# voxel or plane, leaving the stages on target and the files saved
+STOP = "stop"
+
+
+class ScanProgress:
+    """
+    Progress of a scan, with the throughput measured over the last frames.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        window: int = 50,
+    ):
+        """
+        Parameters:
+        - total: Number of frames (voxels or planes) of the scan.
+        - window: Number of recent frames used to measure the throughput.
+        """
+        self.total = total
+        self.done = 0
+        self._times = deque([time.perf_counter()], maxlen=window + 1)
+
+    def update(
+        self,
+        done: int,
+    ) -> dict:
+        """
+        Records that `done` frames are acquired.
+
+        Returns:
+        - dict with "done", "total", "rate" (frames/s) and "eta" (s, None
+          until the rate is known).
+        """
+        self._times.append(time.perf_counter())
+        self.done = done
+        elapsed = self._times[-1] - self._times[0]
+        rate = (len(self._times) - 1) / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else None
+        return {
+            "done": done,
+            "total": self.total,
+            "rate": rate,
+            "eta": eta,
+        }
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+
+def format_progress(progress: dict) -> str:
+    """
+    Returns a one-line description of a progress dict, for the widgets.
+    """
+    text = f"{progress['done']}/{progress['total']}"
+    if progress["rate"] > 0:
+        text += f" - {progress['rate']:.1f} frames/s"
+    if progress["eta"] is not None:
+        text += f" - ETA {format_duration(progress['eta'])}"
+    return text
@@ -0,0 +1,763 @@
+import json
+import os
+import threading
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+
+import numpy as np
+
+from app_func.frame_buffer import (
+    FRAME_META,
+    FrameRingBuffer,
+)
+from app_func.spill import (
+    SPILL_NAME,
+    SpillFile,
+)
+
+# tifffile, ome_types and skimage are imported by the sinks when a scan is
+# saved, so that they are not loaded when the application starts
+
+
+def save_image(
+    x,
+    y,
+    z,
+    img,
+    spacing,
+    path,
+):
+    """
+    Saves a single voxel image as an OME-TIFF file, embedding spatial metadata.
+
+    Parameters:
+    - x/y/z: Stage position of the voxel (in mm).
+    - img: Image data acquired at this position.
+    - spacing: Step size stored as pixel spacing.
+    - path: Destination folder where the TIFF image will be stored.
+    """
+    from tifffile import tifffile
+
+    x_pos = int(x * 1e3)
+    y_pos = int(y * 1e3)
+    z_pos = int(z * 1e3)
+    tifffile.imwrite(
+        path
+        + "/"
+        + "Z"
+        + str(z_pos)
+        + "_X"
+        + str(x_pos)
+        + "_Y"
+        + str(y_pos)
+        + ".ome.tif",
+        img,
+        ome=True,
+        metadata={
+            "axes": "YX",
+            "spacing": spacing,
+            "unit": "µm",
+            "Plane": {
+                "PositionX": x_pos,
+                "PositionY": y_pos,
+                "PositionZ": z_pos,
+                "PositionXUnit": "µm",
+                "PositionYUnit": "µm",
+                "PositionZUnit": "µm",
+            },
+        },
+    )
+
+
+class VoxelFileSink:
+    """
+    Writes one OME-TIFF file per voxel (Z..._X..._Y....ome.tif).
+
+    A resumed scan simply adds the missing voxel files.
+
+    Like every sink, write() and close() return the indices of the voxels
+    the files now hold for good, in the order they were written.
+    """
+
+    # frame data written but not held for good yet, at most
+    uncommitted_bytes = 0
+
+    def __init__(
+        self,
+        path: str,
+        shape=None,
+        resume: bool = False,
+    ):
+        self.path = path
+
+    def write(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ):
+        save_image(x, y, z, img, spacing, self.path)
+        return [index]
+
+    def close(self):
+        return []
+
+
+class PlaneFileSink:
+    """
+    Writes one plain TIFF file per frame, named after its acquisition order
+    (0.tif, 1.tif, ...). This is the historical output of the fast scan.
+    """
+
+    uncommitted_bytes = 0
+
+    def __init__(
+        self,
+        path: str,
+        shape=None,
+        resume: bool = False,
+    ):
+        self.path = path
+        self.count = 0
+
+    def write(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ):
+        from skimage.io import imsave
+
+        imsave(
+            self.path + "/" + str(self.count) + ".tif",
+            img,
+        )
+        self.count += 1
+        return [index]
+
+    def close(self):
+        return []
+
+
+class OmeStackSink:
+    """
+    Appends every voxel of a scan into a single BigTIFF file.
+
+    Frames are written as consecutive pages and their stage positions are kept
+    in memory (three floats per voxel). When the file is closed, one OME-XML
+    header holding the whole position table and the grid index of every
+    frame is written into the first page: only then are its voxels saved. A
+    new part (scan_001.ome.tif, ...) is started when max_bytes is reached,
+    and when a scan is resumed.
+
+    A part left without its OME-XML header by a crash is removed when the
+    scan is resumed (its frames are still in the spill file), and the voxels
+    held by the finished parts are not written again.
+    """
+
+    uncommitted_bytes = 4 * 1024**3
+
+    def __init__(
+        self,
+        path: str,
+        shape=None,
+        resume: bool = False,
+        name: str = "scan",
+        max_bytes: int = uncommitted_bytes,
+    ):
+        """
+        Parameters:
+        - path: Destination folder.
+        - shape: Scan grid shape (unused, frames are simply appended).
+        - resume: Keep the parts of an interrupted scan and add new ones.
+        - name: Prefix of the stack files.
+        - max_bytes: Maximum image data size of a single file.
+        """
+        self.path = path
+        self.name = name
+        self.max_bytes = max_bytes
+        self.uncommitted_bytes = max_bytes
+        self.part = 0
+        self.saved = set()  # grid indices held by the finished parts
+        if resume:
+            self._resume_parts()
+        self._tif = None
+        self._filename = None
+        self._planes = []
+        self._indices = []  # grid index of every frame of the part
+        self._pending = []  # voxels saved once the part is finished
+        self._nbytes = 0
+        self._shape = None
+        self._dtype = None
+        self._spacing = None
+
+    def write(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ):
+        index = tuple(int(i) for i in index)
+        saved = []
+        if index in self.saved:
+            # resumed scan: already in a finished part
+            self._pending.append(index)
+            if self._tif is None:
+                saved, self._pending = self._pending, []
+            return saved
+        if self._tif is not None and self._nbytes + img.nbytes > self.max_bytes:
+            saved = self._finish_part()
+        if self._tif is None:
+            self._open_part(img, spacing)
+        # the placeholder description is replaced by OME-XML in _finish_part
+        self._tif.write(
+            img,
+            description=PART_PLACEHOLDER if not self._planes else None,
+            metadata=None,
+        )
+        self._planes.append((x * 1e3, y * 1e3, z * 1e3))
+        self._indices.append(index)
+        self._pending.append(index)
+        self._nbytes += img.nbytes
+        return saved
+
+    def close(self):
+        if self._tif is not None:
+            return self._finish_part()
+        saved, self._pending = self._pending, []
+        return saved
+
+    def _resume_parts(self):
+        from tifffile import tifffile
+
+        while os.path.exists(self._part_filename(self.part)):
+            filename = self._part_filename(self.part)
+            with tifffile.TiffFile(filename) as tif:
+                description = tif.pages[0].description
+            if description == PART_PLACEHOLDER:
+                # unfinished part, rewritten from the spill file
+                os.remove(filename)
+                break
+            self.saved.update(_part_indices(description))
+            self.part += 1
+
+    def _open_part(
+        self,
+        img,
+        spacing,
+    ):
+        from tifffile import tifffile
+
+        self._filename = self._part_filename(self.part)
+        self._tif = tifffile.TiffWriter(
+            self._filename,
+            bigtiff=True,
+            ome=False,
+        )
+        self._planes = []
+        self._indices = []
+        self._nbytes = 0
+        self._shape = img.shape
+        self._dtype = img.dtype
+        self._spacing = spacing
+
+    def _part_filename(
+        self,
+        part: int,
+    ):
+        return os.path.join(self.path, f"{self.name}_{part:03d}.ome.tif")
+
+    def _finish_part(self):
+        from tifffile import tifffile
+
+        self._tif.close()
+        self._tif = None
+        tifffile.tiffcomment(
+            self._filename,
+            comment=self._ome_xml().encode("utf-8"),
+        )
+        self.part += 1
+        saved, self._pending = self._pending, []
+        return saved
+
+    def _ome_xml(self):
+        from ome_types import to_xml
+        from ome_types.model import OME, Image, Pixels, Plane, TiffData
+
+        n = len(self._planes)
+        pixels = Pixels(
+            dimension_order="XYZCT",
+            type=str(self._dtype),
+            size_x=self._shape[-1],
+            size_y=self._shape[-2],
+            size_z=1,
+            size_c=1,
+            size_t=n,
+            physical_size_z=self._spacing * 1e3,
+            physical_size_z_unit="µm",
+            tiff_data_blocks=[TiffData(plane_count=n)],
+            planes=[
+                Plane(
+                    the_z=0,
+                    the_c=0,
+                    the_t=i,
+                    position_x=x,
+                    position_y=y,
+                    position_z=z,
+                    position_x_unit="µm",
+                    position_y_unit="µm",
+                    position_z_unit="µm",
+                )
+                for i, (x, y, z) in enumerate(self._planes)
+            ],
+        )
+        image = Image(
+            name=self.name,
+            description=json.dumps({"grid_indices": self._indices}),
+            pixels=pixels,
+        )
+        return to_xml(OME(images=[image]))
+
+
+# First page description of an OmeStackSink part until it is finished
+PART_PLACEHOLDER = "OME-XML"
+
+
+def _part_indices(description: str):
+    # grid indices of the frames of a finished OmeStackSink part
+    from ome_types import from_xml
+
+    images = from_xml(description).images
+    if not images or not images[0].description:
+        return []
+    try:
+        indices = json.loads(images[0].description)["grid_indices"]
+    except (ValueError, KeyError):
+        return []
+    return [tuple(index) for index in indices]
+
+
+class OmeZarrSink:
+    """
+    Writes a scan into a chunked OME-Zarr (NGFF 0.4) group.
+
+    Level 0 is a (voxel, frame_y, frame_x) array with one chunk per voxel, so
+    a viewer or an analysis script can open the scan lazily and read any
+    frame. NGFF 0.4 allows a single custom axis besides the space axes, so
+    the (Z, X, Y) scan grid is flattened into the "voxel" axis in C order:
+    a Y line is a contiguous range, and level0.reshape(grid_shape + frame
+    shape) gives the full grid (grid_shape is in the multiscales metadata).
+    Downsampled levels (frames binned 2x2 per level) are computed on a
+    background thread while the acquisition goes on. The stage position of
+    every voxel is stored in the (Z, X, Y, 3) "positions" array (x, y, z in
+    µm).
+
+    Requires the optional zarr package.
+    """
+
+    uncommitted_bytes = 0
+
+    def __init__(
+        self,
+        path: str,
+        shape=None,
+        resume: bool = False,
+        name: str = "scan.ome.zarr",
+        levels: int = 3,
+        max_pending: int = 8,
+    ):
+        """
+        Parameters:
+        - path: Destination folder.
+        - shape: Scan grid shape as (num_z, num_x, num_y).
+        - resume: Open the group of an interrupted scan instead of a new one.
+        - name: Name of the zarr group inside the destination folder.
+        - levels: Number of resolution levels, including full resolution.
+        - max_pending: Maximum number of frames waiting to be downsampled.
+        """
+        if shape is None:
+            raise ValueError("The OME-Zarr output needs the scan grid shape")
+        self.path = path
+        self.shape = tuple(shape)
+        self.resume = resume
+        self.name = name
+        self.levels = levels
+        self._root = None
+        self._arrays = []
+        self._positions = None
+        self._spacing = None
+        self._pyramid = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="ZarrPyramid",
+        )
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+
+    def write(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ):
+        if self._root is None:
+            self._open(img, spacing)
+        self._arrays[0][self._voxel(index)] = img
+        self._positions[tuple(index)] = (x * 1e3, y * 1e3, z * 1e3)
+        if self.levels > 1:
+            # bounded, so that a slow disk cannot pile up frames in memory
+            self._pending.acquire()
+            # img is only valid during write(), the pyramid thread gets a copy
+            future = self._pyramid.submit(
+                self._downsample,
+                tuple(index),
+                np.array(img),
+            )
+            future.add_done_callback(lambda _: self._pending.release())
+            self._futures.append(future)
+        return [index]
+
+    def close(self):
+        self._pyramid.shutdown(wait=True)
+        for future in self._futures:
+            # raise errors from the pyramid thread, if any
+            future.result()
+        self._futures = []
+        if self._root is not None:
+            self._root.attrs["multiscales"] = self._multiscales()
+        return []
+
+    def _open(
+        self,
+        img,
+        spacing,
+    ):
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError(
+                "The OME-Zarr output requires zarr: pip install 'zarr<3'"
+            )
+
+        self._spacing = spacing
+        self._root = zarr.open_group(
+            os.path.join(self.path, self.name),
+            mode="a" if self.resume else "w",
+        )
+        frame_y, frame_x = img.shape[-2:]
+        for level in range(self.levels):
+            factor = 2**level
+            self._arrays.append(
+                self._root.require_dataset(
+                    str(level),
+                    shape=(
+                        int(np.prod(self.shape)),
+                        frame_y // factor,
+                        frame_x // factor,
+                    ),
+                    chunks=(1, frame_y // factor, frame_x // factor),
+                    dtype=img.dtype,
+                    fill_value=0,
+                    dimension_separator="/",
+                )
+            )
+        # one chunk per Y line: a voxel only rewrites its own line
+        self._positions = self._root.require_dataset(
+            "positions",
+            shape=self.shape + (3,),
+            chunks=(1, 1, self.shape[2], 3),
+            dtype="f8",
+            fill_value=np.nan,
+        )
+
+    def _downsample(
+        self,
+        index,
+        img,
+    ):
+        for level in range(1, self.levels):
+            h, w = img.shape[-2:]
+            img = (
+                img[: h - h % 2, : w - w % 2]
+                .reshape(h // 2, 2, w // 2, 2)
+                .mean(axis=(1, 3))
+                .astype(img.dtype)
+            )
+            self._arrays[level][self._voxel(index)] = img
+
+    def _voxel(
+        self,
+        index,
+    ) -> int:
+        return int(np.ravel_multi_index(tuple(index), self.shape))
+
+    def _multiscales(self):
+        axes = [
+            {"name": "voxel", "type": "voxel"},
+            {"name": "y", "type": "space"},
+            {"name": "x", "type": "space"},
+        ]
+        datasets = [
+            {
+                "path": str(level),
+                "coordinateTransformations": [
+                    {
+                        "type": "scale",
+                        "scale": [1.0, 2.0**level, 2.0**level],
+                    }
+                ],
+            }
+            for level in range(self.levels)
+        ]
+        return [
+            {
+                "version": "0.4",
+                "name": self.name,
+                "axes": axes,
+                "datasets": datasets,
+                "metadata": {
+                    "step_z_um": self._spacing * 1e3,
+                    "grid_axes": ["z", "x", "y"],
+                    "grid_shape": list(self.shape),
+                },
+            }
+        ]
+
+
+# Available output formats for scan frames
+FILE_FORMATS = {
+    "voxel": VoxelFileSink,
+    "ome-stack": OmeStackSink,
+    "ome-zarr": OmeZarrSink,
+    "plane": PlaneFileSink,
+}
+
+
+# Frames between two fsync calls of the spill file
+SPILL_SYNC_EVERY = 16
+
+
+def spill_frames(
+    uncommitted_bytes: int,
+    frame_bytes: int,
+) -> int:
+    """
+    Returns the number of frames the spill file of a scan holds at most: the
+    one being written, and those the sink has written but does not hold for
+    good yet (uncommitted_bytes).
+    """
+    return 2 + uncommitted_bytes // max(frame_bytes, 1)
+
+
+def spill_bytes(
+    file_format: str,
+    frame_bytes: int,
+) -> int:
+    """
+    Returns the largest size (bytes) of the spill file of a scan.
+    """
+    frames = spill_frames(
+        FILE_FORMATS[file_format].uncommitted_bytes,
+        frame_bytes,
+    )
+    return frames * (frame_bytes + FRAME_META.itemsize)
+
+
+class ScanWriter:
+    """
+    Persists scan frames on a background thread while the acquisition goes on.
+
+    The acquisition loop pushes each voxel with put(). Frames are copied into
+    a preallocated FrameRingBuffer and written by a single consumer thread.
+    When the buffer is full, put() blocks until the disk has caught up, so
+    memory stays constant whatever the scan size.
+
+    Sinks receive a view on a buffer slot, which is reused once write()
+    returns: a sink keeping the frame for later must copy it.
+
+    With spill=True, the writer thread also writes every frame to a
+    crash-safe spill file (see app_func.spill) just before handing it to the
+    sink, and releases it once the sink holds it for good, so the spill file
+    stays within spill_frames() frames and the acquisition never waits on it.
+    Only the frames still waiting in the buffer are lost in a crash. The
+    spill file is removed once the scan is saved, and kept for recovery
+    otherwise.
+
+    on_written(index) is called from the writer thread once a voxel is saved.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_format: str = "voxel",
+        maxsize: int = 16,
+        shape=None,
+        spill_path: str = None,
+        spill: bool = False,
+        resume: bool = False,
+        on_written=None,
+    ):
+        """
+        Parameters:
+        - path: Destination folder where images will be stored.
+        - file_format: One of FILE_FORMATS.
+        - maxsize: Maximum number of frames waiting to be written.
+        - shape: Scan grid shape as (num_z, num_x, num_y), needed by "ome-zarr".
+        - spill_path: File backing the frame buffer (memmap), for large maxsize.
+        - spill: Also append the frames to a crash-safe spill file in path.
+        - resume: Add the frames to the files of an interrupted scan.
+        - on_written: Callable receiving the (z, x, y) index of each saved voxel.
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Unknown file format: {file_format}")
+        self.path = path
+        self.sink = FILE_FORMATS[file_format](path, shape=shape, resume=resume)
+        self.on_written = on_written
+        self.written = 0
+        self.buffer = FrameRingBuffer(maxsize, spill_path=spill_path)
+        self.spill = None
+        if spill:
+            self.spill = SpillFile(
+                os.path.join(path, SPILL_NAME),
+                file_format=file_format,
+                shape=shape,
+                sync_every=SPILL_SYNC_EVERY,
+                slots=None,  # set from the size of the first frame
+            )
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ScanWriter",
+            daemon=True,
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        """
+        Creates the destination folder and starts the writer thread.
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self._thread.start()
+
+    def put(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+    ):
+        """
+        Queues one voxel for writing. Blocks while the buffer is full.
+
+        index is the (z, x, y) position of the voxel in the scan grid.
+
+        Raises the writer error, if any, so the scan stops instead of
+        acquiring frames that cannot be saved.
+        """
+        if self._error is not None:
+            raise self._error
+        self.buffer.put(index, x, y, z, img, spacing)
+
+    def close(self):
+        """
+        Waits until every queued frame is written and stops the thread.
+        """
+        self.buffer.close()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.buffer.free()
+        if self.spill is not None:
+            # the spill file is only needed if the scan could not be saved
+            self.spill.close(remove=self._error is None)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            slot = self.buffer.get()
+            if slot is None:
+                break
+            if self._error is not None:
+                # keep draining so that the producer is never blocked forever
+                self.buffer.release()
+                continue
+            meta = self.buffer.meta[slot]
+            index = tuple(int(i) for i in meta["index"])
+            x, y, z = meta["position"]
+            try:
+                if self.spill is not None:
+                    self._spill(slot)
+                saved = self.sink.write(
+                    index,
+                    float(x),
+                    float(y),
+                    float(z),
+                    self.buffer.frames[slot],
+                    float(meta["spacing"]),
+                )
+                self.written += 1
+                self._saved(saved)
+            except Exception as e:
+                print(f"[ERROR] Could not save frame: {e}")
+                self._error = e
+            self.buffer.release()
+        try:
+            self._saved(self.sink.close())
+        except Exception as e:
+            print(f"[ERROR] Could not close scan file: {e}")
+            if self._error is None:
+                self._error = e
+
+    def _spill(
+        self,
+        slot: int,
+    ):
+        meta = self.buffer.meta[slot]
+        frame = self.buffer.frames[slot]
+        if self.spill.slots is None:
+            self.spill.slots = spill_frames(
+                self.sink.uncommitted_bytes,
+                frame.nbytes,
+            )
+        x, y, z = meta["position"]
+        self.spill.append(
+            meta["index"],
+            x,
+            y,
+            z,
+            frame,
+            meta["spacing"],
+            meta["timestamp"],
+        )
+
+    def _saved(
+        self,
+        indices,
+    ):
+        if self.on_written is not None:
+            for index in indices:
+                self.on_written(index)
+        # the sinks save the frames in the order they were put
+        if self.spill is not None and indices:
+            self.spill.release(len(indices))
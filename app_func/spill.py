@@ -0,0 +1,268 @@
+"""
+Crash-safe spill file for the frames of a running scan.
+
+Every frame is written to the spill file just before the scan files, and
+kept there until they hold it for good, so the frames of a scan interrupted
+by a crash can still be saved afterwards:
+
+    python -m app_func.spill recover <folder>/scan.spill [--format ome-stack]
+
+Layout: a HEADER_SIZE bytes header (magic, number of frames appended, number
+of frames released, number of record slots, JSON description) followed by a
+ring of fixed-size records, each holding a FRAME_META entry and the frame
+data. Frame n is stored in slot n % slots, which is only reused once frame
+n - slots is released, so the file never grows beyond `slots` records. The
+appended count is only increased once its record has been written, so a
+record cut by a crash is never read back.
+"""
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from app_func.frame_buffer import (
+    FRAME_META,
+)
+
+MAGIC = b"LSSPILL2"
+HEADER_SIZE = 4096
+SPILL_NAME = "scan.spill"
+
+# magic, frames appended, frames released, record slots, JSON description size
+_HEADER = struct.Struct("<8sQQQI")
+_APPENDED_OFFSET = len(MAGIC)
+_RELEASED_OFFSET = _APPENDED_OFFSET + 8
+
+
+def record_dtype(
+    dtype,
+    frame_shape,
+) -> np.dtype:
+    return np.dtype(
+        [
+            ("meta", FRAME_META),
+            ("frame", np.dtype(dtype), tuple(frame_shape)),
+        ]
+    )
+
+
+class SpillFile:
+    """
+    Ring file receiving every frame of a scan until it is saved.
+
+    The file is created with the first frame, whose shape and type are stored
+    in the header. The data is handed to the operating system after each
+    frame, which is enough to survive a crash of the application. sync_every
+    also forces it to the disk every n frames, against power losses.
+
+    Frames are released in the order they were appended, once the scan files
+    hold them (release()). append() raises if every slot holds a frame not
+    released yet. Both are called by the writer thread of the scan.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_format: str = "voxel",
+        shape=None,
+        sync_every: int = 0,
+        slots: int = 64,
+    ):
+        """
+        Parameters:
+        - path: Spill file to create.
+        - file_format: Output format of the scan, used by the recovery.
+        - shape: Scan grid shape as (num_z, num_x, num_y).
+        - sync_every: Number of frames between two fsync calls (0: never).
+        - slots: Number of frames the file holds. Can be changed until the
+          first frame is appended.
+        """
+        self.path = path
+        self.file_format = file_format
+        self.shape = None if shape is None else [int(n) for n in shape]
+        self.sync_every = sync_every
+        self.slots = slots
+        self.count = 0  # frames appended
+        self.released = 0
+        self._file = None
+        self._record_size = 0
+        self._meta = np.zeros(1, dtype=FRAME_META)
+
+    def append(
+        self,
+        index,
+        x,
+        y,
+        z,
+        img,
+        spacing,
+        timestamp,
+    ):
+        if self._file is None:
+            self._open(img)
+        if self.count - self.released >= self.slots:
+            raise RuntimeError(
+                f"Spill file full: {self.slots} frames not saved by the scan"
+            )
+        self._meta["index"][0] = index
+        self._meta["position"][0] = (x, y, z)
+        self._meta["spacing"][0] = spacing
+        self._meta["timestamp"][0] = timestamp
+        slot = self.count % self.slots
+        self._file.seek(HEADER_SIZE + slot * self._record_size)
+        self._file.write(self._meta.tobytes())
+        self._file.write(memoryview(np.ascontiguousarray(img)).cast("B"))
+        self._file.flush()
+        # commit the frame
+        self.count += 1
+        self._write_counter(_APPENDED_OFFSET, self.count)
+        if self.sync_every and self.count % self.sync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def release(
+        self,
+        n: int = 1,
+    ):
+        """
+        Frees the n oldest frames, saved in the scan files.
+        """
+        self.released += n
+        if self._file is not None:
+            self._write_counter(_RELEASED_OFFSET, self.released)
+
+    def close(
+        self,
+        remove: bool = False,
+    ):
+        """
+        Closes the file, and removes it if remove is True (scan saved).
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if remove:
+                os.remove(self.path)
+
+    def _write_counter(
+        self,
+        offset: int,
+        value: int,
+    ):
+        self._file.seek(offset)
+        self._file.write(struct.pack("<Q", value))
+        self._file.flush()
+
+    def _open(self, img):
+        description = json.dumps(
+            {
+                "dtype": img.dtype.str,
+                "frame_shape": list(img.shape),
+                "file_format": self.file_format,
+                "shape": self.shape,
+            }
+        ).encode("utf-8")
+        if _HEADER.size + len(description) > HEADER_SIZE:
+            raise ValueError("Spill file description is too long")
+        self._record_size = record_dtype(img.dtype, img.shape).itemsize
+        self._file = open(self.path, "wb")
+        header = _HEADER.pack(MAGIC, 0, 0, self.slots, len(description))
+        self._file.write((header + description).ljust(HEADER_SIZE, b"\0"))
+
+
+def read_spill(path: str):
+    """
+    Opens a spill file written by SpillFile.
+
+    Returns:
+    - Tuple of (description dict, memory-mapped ring of records with "meta"
+      and "frame" fields, slots of the frames not released, oldest first).
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+    magic, count, released, slots, size = _HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a spill file")
+    description = json.loads(header[_HEADER.size : _HEADER.size + size])
+    dtype = record_dtype(description["dtype"], description["frame_shape"])
+    available = min(slots, (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize)
+    # a record cut by a crash is not counted
+    order = [n % slots for n in range(released, count) if n % slots < available]
+    if available == 0:
+        return description, np.zeros(0, dtype=dtype), order
+    records = np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=HEADER_SIZE,
+        shape=(available,),
+    )
+    return description, records, order
+
+
+def recover(
+    spill_path: str,
+    path: str = None,
+    file_format: str = None,
+    on_written=None,
+) -> int:
+    """
+    Saves the frames of an interrupted scan in the normal output format.
+
+    Parameters:
+    - spill_path: Spill file left by the scan.
+    - path: Destination folder. Defaults to the folder of the spill file.
+    - file_format: One of FILE_FORMATS. Defaults to the format of the scan.
+    - on_written: Callable receiving the (z, x, y) index of each saved voxel.
+
+    The frames are added to the files already saved by the scan, skipping
+    those they already hold.
+
+    Returns:
+    - Number of frames recovered.
+    """
+    from app_func.scan_writer import ScanWriter
+
+    description, records, order = read_spill(spill_path)
+    if path is None:
+        path = os.path.dirname(os.path.abspath(spill_path))
+    if file_format is None:
+        file_format = description["file_format"]
+    with ScanWriter(
+        path,
+        file_format=file_format,
+        shape=description["shape"],
+        resume=True,
+        on_written=on_written,
+    ) as writer:
+        for slot in order:
+            record = records[slot]
+            meta = record["meta"]
+            x, y, z = meta["position"]
+            writer.put(
+                tuple(int(i) for i in meta["index"]),
+                float(x),
+                float(y),
+                float(z),
+                record["frame"],
+                float(meta["spacing"]),
+            )
+    return len(order)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    recover_parser = commands.add_parser(
+        "recover",
+        help="save the frames of an interrupted scan",
+    )
+    recover_parser.add_argument("spill", help="spill file of the scan")
+    recover_parser.add_argument("--output", help="destination folder")
+    recover_parser.add_argument("--format", help="output file format")
+    args = parser.parse_args()
+
+    n = recover(args.spill, path=args.output, file_format=args.format)
+    print(f"{n} frames recovered from {args.spill}")
@@ -0,0 +1,202 @@
+import builtins
+import os
+import sys
+import threading
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from contextlib import (
+    contextmanager,
+)
+
+
+class StartupTimer:
+    """
+    Records how long each step of the application startup takes.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def section(
+        self,
+        name: str,
+    ):
+        """
+        Times the enclosed block under the given name.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def record(
+        self,
+        name: str,
+        duration: float,
+    ):
+        """
+        Adds a duration (s) to a step, e.g. when it is timed elsewhere.
+        """
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def report(
+        self,
+        min_duration: float = 0.0,
+    ) -> str:
+        """
+        Returns the timing breakdown, one step per line.
+
+        Parameters:
+        - min_duration: Steps shorter than this (s) are not listed.
+        """
+        with self._lock:
+            lines = [
+                f"  {name}: {t:.2f} s"
+                for name, t in self.timings.items()
+                if t >= min_duration
+            ]
+        total = time.perf_counter() - self.start
+        return "\n".join(["Startup timing:"] + lines + [f"  total: {total:.2f} s"])
+
+
+class ImportProfiler:
+    """
+    Times the first import of every top-level package (napari, pipython...).
+
+    The time spent importing the dependencies of a package is subtracted from
+    its entry, so each package only accounts for its own modules and the
+    entries add up to the total import time.
+    """
+
+    def __init__(
+        self,
+        timer: StartupTimer,
+    ):
+        """
+        Parameters:
+        - timer: StartupTimer receiving an "import <package>" entry per package.
+        """
+        self.timer = timer
+        self._import = None
+        self._local = threading.local()
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(
+        self,
+        name,
+        globals=None,
+        locals=None,
+        fromlist=(),
+        level=0,
+    ):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        # one [package, time spent in nested packages] entry per import level
+        stack = self._local.__dict__.setdefault("stack", [])
+        package = name.partition(".")[0]
+        if stack and stack[-1][0] == package:
+            return self._import(name, globals, locals, fromlist, level)
+        entry = [package, 0.0]
+        stack.append(entry)
+        t0 = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - t0
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            self.timer.record(f"import {package}", elapsed - entry[1])
+
+
+def _init_pi(
+    pi_vals,
+    timer: StartupTimer,
+):
+    from app_func.app_functions import MOTION_CALIBRATION
+    from pi_contol.PiController import PiController
+    from pi_contol.motion_profile import MotionProfile
+
+    with timer.section("PI daisy chain"):
+        pi_controller = PiController()
+    if os.path.exists(MOTION_CALIBRATION):
+        try:
+            pi_controller.motion_profile = MotionProfile.load(MOTION_CALIBRATION)
+        except Exception as e:
+            print(f"[ERROR] Could not load the motion calibration: {e}")
+    with timer.section("PI initial positions"):
+        pi_controller.move_many(
+            {i + 1: value for i, value in enumerate(pi_vals)}
+        ).result()
+    return pi_controller
+
+
+def _init_core(
+    sys_config: str,
+    timer: StartupTimer,
+):
+    from pymmcore_plus import CMMCorePlus
+
+    with timer.section("Micro-Manager"):
+        core = CMMCorePlus()
+        core.loadSystemConfiguration(sys_config)
+    return core
+
+
+def _init_daq(
+    galvo_vals,
+    timer: StartupTimer,
+):
+    from galvo.galvo_output import get_galvo_output
+
+    with timer.section("DAQ"):
+        try:
+            output = get_galvo_output()
+            for galvo_id, value in enumerate(galvo_vals, start=1):
+                output.set_position(value, galvo_id)
+        except Exception as e:
+            print(f"Error setting galvo positions: {e}")
+
+
+def init_hardware(
+    pi_vals,
+    galvo_vals,
+    sys_config: str,
+    timer: StartupTimer,
+):
+    """
+    Connects the PI stages, Micro-Manager and the DAQ at the same time.
+
+    The four stages are then moved to their saved positions in parallel, so
+    the startup lasts as long as the slowest device instead of the sum.
+
+    Parameters:
+    - pi_vals: Saved positions of the four PI controllers.
+    - galvo_vals: Saved voltages of the two galvos.
+    - sys_config: Micro-Manager configuration file.
+    - timer: StartupTimer collecting the duration of each device.
+
+    Returns:
+    - Tuple of (PiController, CMMCorePlus).
+    """
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="Startup") as pool:
+        pi_future = pool.submit(_init_pi, pi_vals, timer)
+        core_future = pool.submit(_init_core, sys_config, timer)
+        daq_future = pool.submit(_init_daq, galvo_vals, timer)
+        daq_future.result()
+        return pi_future.result(), core_future.result()
@@ -1,7 +1,5 @@
-import numpy as np
-import PyDAQmx
-from PyDAQmx import (
-    Task,
+from galvo.galvo_output import (
+    get_galvo_output,
 )
 
 
@@ -20,56 +18,21 @@ def set_galvos_position(
 
     Notes:
     - Only galvo_id values of 1 or 2 are valid.
-    - Automatically opens and closes the DAQ task.
+    - Uses the persistent output task shared by the application (see
+      galvo_output.GalvoOutput), so no task is created per call.
     """
 
-    task = Task()
-    if galvo_id in [
+    if galvo_id not in [
         1,
         2,
     ]:
-        if galvo_id == 1:
-            task.CreateAOVoltageChan(
-                "Dev1/ao0",
-                "",
-                -5,
-                5,
-                PyDAQmx.DAQmx_Val_Volts,
-                None,
-            )
-        else:
-            task.CreateAOVoltageChan(
-                "Dev1/ao1",
-                "",
-                -5,
-                5,
-                PyDAQmx.DAQmx_Val_Volts,
-                None,
-            )
-    else:
         print("Galvo id should be 1 or 2")
         return None
     try:
-
-        data = np.array(
-            [value],
-            dtype=np.float64,
-        )
-
-        task.WriteAnalogF64(
-            1,
-            True,
-            10.0,
-            PyDAQmx.DAQmx_Val_GroupByChannel,
-            data,
-            None,
-            None,
+        get_galvo_output().set_position(
+            value,
+            galvo_id,
         )
-        # print("data envoyee:",data)
-
-        # Fermer les tâches après l'écriture
-        task.StopTask()
-        task.ClearTask()
 
     except Exception as e:
         print(f"Error setting galvo positions: {e}")
@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+
+try:
+    import PyDAQmx
+    from PyDAQmx import (
+        Task,
+    )
+except (ImportError, NotImplementedError, OSError):
+    # NI-DAQmx is not installed: only the simulated output is available
+    PyDAQmx = None
+
+
+class GalvoOutput:
+    """
+    Long-lived analog output driving both galvos (Dev1/ao0 and Dev1/ao1).
+
+    A single two-channel task is created and started once, so a static
+    position update is a single on-demand write instead of a full task
+    create/configure/clear cycle. The last value of each channel is kept,
+    since every write updates both channels.
+    """
+
+    def __init__(
+        self,
+        channels: str = "Dev1/ao0:1",
+        v_min: float = -5,
+        v_max: float = 5,
+    ):
+        """
+        Parameters:
+        - channels: Physical channels of galvo 1 and galvo 2.
+        - v_min/v_max: Output voltage range.
+        """
+        self.channels = channels
+        self.v_min = v_min
+        self.v_max = v_max
+        self.values = [0.0, 0.0]
+        self._task = None
+        self._lock = threading.Lock()
+
+    def set_position(
+        self,
+        value: float,
+        galvo_id: int,
+    ):
+        """
+        Sets the voltage of one galvo.
+
+        Parameters:
+        - value: Voltage to send to the galvo.
+        - galvo_id: 1 for ao0, 2 for ao1.
+        """
+        if galvo_id not in [1, 2]:
+            raise ValueError("Galvo id should be 1 or 2")
+        with self._lock:
+            self.values[galvo_id - 1] = value
+            self._write()
+
+    def release(self):
+        """
+        Clears the task so that the channels can be used by a hardware-timed
+        task (e.g. the light sheet scans). The next write opens it again.
+        """
+        with self._lock:
+            if self._task is not None:
+                self._task.StopTask()
+                self._task.ClearTask()
+                self._task = None
+
+    def _open(self):
+        task = Task()
+        task.CreateAOVoltageChan(
+            self.channels,
+            "",
+            self.v_min,
+            self.v_max,
+            PyDAQmx.DAQmx_Val_Volts,
+            None,
+        )
+        task.StartTask()
+        self._task = task
+
+    def _write(self):
+        if self._task is None:
+            self._open()
+        self._task.WriteAnalogF64(
+            1,
+            False,
+            10.0,
+            PyDAQmx.DAQmx_Val_GroupByChannel,
+            np.array(self.values, dtype=np.float64),
+            None,
+            None,
+        )
+
+
+class SimulatedGalvoOutput(GalvoOutput):
+    """
+    Galvo output without hardware: values are only stored.
+    """
+
+    def release(self):
+        pass
+
+    def _write(self):
+        pass
+
+
+_galvo_output = None
+
+
+def get_galvo_output(simulate: bool = None) -> GalvoOutput:
+    """
+    Returns the galvo output shared by the whole application.
+
+    Parameters:
+    - simulate: Force the simulated backend. By default, it is used only when
+      PyDAQmx is not available.
+    """
+    global _galvo_output
+    if _galvo_output is None:
+        if simulate is None:
+            simulate = PyDAQmx is None
+        _galvo_output = SimulatedGalvoOutput() if simulate else GalvoOutput()
+    return _galvo_output
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from galvo.galvo_output import (
+    get_galvo_output,
+)
+
+
+class GalvoWriter:
+    """
+    Applies requested galvo voltages on a background thread.
+
+    Only the most recent request of each galvo is kept: when a slider is
+    dragged across thousands of steps, intermediate values are dropped and the
+    DAQ is written at most max_rate times per second. on_applied(galvo_id,
+    value) is called from the writer thread after each write.
+    """
+
+    def __init__(
+        self,
+        output=None,
+        max_rate: float = 100.0,
+        on_applied=None,
+    ):
+        """
+        Parameters:
+        - output: GalvoOutput to write to. Defaults to the shared output.
+        - max_rate: Maximum number of DAQ writes per second.
+        - on_applied: Callable receiving (galvo_id, value) after each write.
+        """
+        self.output = output if output is not None else get_galvo_output()
+        self.min_period = 1 / max_rate
+        self.on_applied = on_applied
+        self._requested = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name="GalvoWriter",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def request(
+        self,
+        value: float,
+        galvo_id: int,
+    ):
+        """
+        Requests a new voltage for a galvo, replacing any pending request.
+        """
+        with self._cond:
+            self._requested[galvo_id] = value
+            self._cond.notify()
+
+    def stop(self):
+        """
+        Applies the pending requests and stops the thread.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        last_write = 0.0
+        while True:
+            with self._cond:
+                while not self._requested and not self._stop:
+                    self._cond.wait()
+                if not self._requested:
+                    break
+            # leave time for more requests to be merged
+            delay = last_write + self.min_period - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self._cond:
+                pending = self._requested
+                self._requested = {}
+            for galvo_id, value in pending.items():
+                try:
+                    self.output.set_position(value, galvo_id)
+                except Exception as e:
+                    print(f"Error setting galvo positions: {e}")
+                    continue
+                if self.on_applied is not None:
+                    self.on_applied(galvo_id, value)
+            last_write = time.perf_counter()
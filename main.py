@@ -1,23 +1,32 @@
-from widgets.PiControlWidget import (
-    PIControlWidget,
-)
-from widgets.GalvoWidget import (
-    SlidesWidget,
-)
-from widgets.ScansWidget import ScanBTNWidget, FastScanBTNWidget
-from app_func.app_functions import *
+import sys
+import time
 
-import napari
-from pymmcore_plus import (
-    CMMCorePlus,
-)
+from app_func.startup import ImportProfiler, StartupTimer, init_hardware
 
-from pi_contol.PiController import PiController
+# the startup time of each step is printed once the window is shown, and
+# python main.py --profile-startup also splits the imports per package
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+timer = StartupTimer()
+profiler = ImportProfiler(timer)
+if PROFILE_STARTUP:
+    profiler.install()
 
-from PyQt5.QtWidgets import QApplication, QSplashScreen
-from PyQt5.QtGui import QPixmap
+# the imports below are timed by the profiler, hence after its installation
+from widgets.PiControlWidget import PIControlWidget  # noqa: E402
+from widgets.GalvoWidget import SlidesWidget  # noqa: E402
+from widgets.ScansWidget import ScanBTNWidget, FastScanBTNWidget  # noqa: E402
+from app_func.app_functions import *  # noqa: E402
 
-import sys
+import napari  # noqa: E402
+
+from PyQt5.QtWidgets import QApplication, QSplashScreen  # noqa: E402
+from PyQt5.QtGui import QPixmap  # noqa: E402
+
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+if not PROFILE_STARTUP:
+    # without the profiler, the imports are timed as a whole
+    timer.record("imports", time.perf_counter() - timer.start)
 
 if __name__ == "__main__":
 
@@ -31,7 +40,7 @@ if __name__ == "__main__":
     splash.show()
     qt_app.processEvents()
 
-    params = load_yaml(CONFIG)
+    params = get_config_store(CONFIG).data()
 
     galvo1_val = float(params["galvo1_val"])
     galvo2_val = float(params["galvo2_val"])
@@ -47,62 +56,50 @@ if __name__ == "__main__":
         pi4_val,
     ]
 
-    pi_controller = PiController()
-
-    core = CMMCorePlus()
-    core.loadSystemConfiguration(SYS_CONFIG)
-
-    app = napari.Viewer()
-
-    for i in range(
-        1,
-        5,
-    ):
-        if i == 1:
-            (
-                mini,
-                maxi,
-            ) = (
-                8,
-                16.999,
-            )
-        elif i == 2:
+    # PI, Micro-Manager and DAQ are initialized in parallel
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        init = pool.submit(
+            init_hardware,
+            pi_vals,
+            [galvo1_val, galvo2_val],
+            SYS_CONFIG,
+            timer,
+        )
+        # keep the splash screen responsive
+        while not init.done():
+            qt_app.processEvents()
+            time.sleep(0.02)
+    pi_controller, core = init.result()
+
+    with timer.section("napari viewer"):
+        app = napari.Viewer()
+
+    with timer.section("widgets"):
+        for i in range(
+            1,
+            5,
+        ):
             (
                 mini,
                 maxi,
-            ) = (
-                -360,
-                360,
+            ) = PI_LIMITS[i]
+
+            pi_widget = PIControlWidget(
+                pi_controller,
+                pi_vals[i - 1],
+                controller_id=i,
+                mini=mini,
+                maxi=maxi,
+                move_to_initial=False,
             )
-        elif i == 3:
-            (
-                mini,
-                maxi,
-            ) = (
-                4,
-                16.999,
-            )
-        else:
-            (
-                mini,
-                maxi,
-            ) = (
-                0.001,
-                16.999,
+            app.window.add_dock_widget(
+                pi_widget,
+                area="right",
             )
+            pi_widgets.append(pi_widget)
 
-        pi_widget = PIControlWidget(
-            pi_controller,
-            pi_vals[i - 1],
-            controller_id=i,
-            mini=mini,
-            maxi=maxi,
-        )
-        app.window.add_dock_widget(
-            pi_widget,
-            area="right",
-        )
-        pi_widgets.append(pi_widget)
+    # refresh the shared position cache in the background
+    pi_controller.start_polling(float(params.get("pi_poll_interval", 0.2)))
 
     sl_widget = SlidesWidget(
         galvo1_val,
@@ -129,5 +126,7 @@ if __name__ == "__main__":
     )
 
     splash.finish(app.window._qt_window)
+    profiler.uninstall()
+    print(timer.report(min_duration=0.01))
 
     napari.run()
@@ -1,6 +1,13 @@
 import time
 import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pipython import GCSDevice, PILogger
+from pi_contol.command_broker import (
+    CommandBroker,
+    PRIORITY_MOTION,
+)
+from pi_contol.position_cache import PositionCache, PositionPoller
 
 # Disable pipython logging
 PILogger.setLevel(logging.CRITICAL + 1)
@@ -8,6 +15,15 @@ PILogger.setLevel(logging.CRITICAL + 1)
 
 class PiController:
     def __init__(self):
+        self.velocities = {}  # device id -> last velocity set or read
+        self.accelerations = {}  # device id -> last acceleration set
+        self.motion_profile = None  # MotionProfile choosing VEL/ACC per move
+        self.targets = {}  # device id -> last commanded position
+        self.move_stats = {}  # device id -> recent (duration, predicted, polls)
+        self._moves = {}  # device id -> (start time, predicted duration)
+        self._waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PiWait")
+        self.positions = PositionCache()
+        self.poller = None
         try:
             self.devices = []
 
@@ -29,20 +45,119 @@ class PiController:
         except Exception as e:
             print(f"[ERROR] Could not connect to daisy chain: {e}")
 
-    def get_pos(self, device_id: int) -> float:
+        # every command to the chain goes through this single thread
+        self.broker = CommandBroker(self.devices)
+
+    def start_polling(self, interval: float = 0.2) -> None:
+        """
+        Start the background thread refreshing the position cache.
+
+        Parameters:
+        - interval (float): Polling period in seconds.
+        """
+        if self.poller is None:
+            self.poller = PositionPoller(self, interval)
+            self.poller.start()
+
+    def close(self) -> None:
+        """
+        Stop the background threads talking to the daisy chain.
+        """
+        if self.poller is not None:
+            self.poller.stop()
+        self._waiter.shutdown(wait=True)
+        self.broker.close()
+
+    def get_pos(self, device_id: int, max_age: float = None) -> float:
         """
         Returns the position of a given controller.
 
         Parameters:
         - device_id (int): Index of the controller (1-based).
+        - max_age (float): If given, a cached position younger than max_age
+          seconds is returned without querying the controller.
 
         Returns:
         - float: Current position on axis 1.
         """
-        pos_device = self.devices[device_id - 1].gcscommands.qPOS(1)
+        if max_age is not None:
+            cached = self.positions.get(device_id, max_age)
+            if cached is not None:
+                return cached[0]
+        pos_device = self.broker.call(device_id, "qPOS", 1)
         for _, value in pos_device.items():
             return value
 
+    def set_velocity(self, controller_id: int, value: float, axe: int = 1) -> None:
+        """
+        Set the velocity of a controller, used to predict move durations.
+
+        Parameters:
+        - controller_id (int): Index of the controller (1-based).
+        - value (float): Velocity in units per second.
+        - axe (int): Axis. Default is 1.
+        """
+        self.broker.call(
+            controller_id, "VEL", axe, value, priority=PRIORITY_MOTION
+        )
+        self.velocities[controller_id] = value
+
+    def set_acceleration(
+        self, controller_id: int, value: float, axe: int = 1
+    ) -> None:
+        """
+        Set the acceleration (and deceleration) of a controller.
+
+        Parameters:
+        - controller_id (int): Index of the controller (1-based).
+        - value (float): Acceleration in units per second squared.
+        - axe (int): Axis. Default is 1.
+        """
+        self.broker.call(
+            controller_id, "ACC", axe, value, priority=PRIORITY_MOTION
+        )
+        self.broker.call(
+            controller_id, "DEC", axe, value, priority=PRIORITY_MOTION
+        )
+        self.accelerations[controller_id] = value
+
+    def is_on_target(self, controller_id: int, axe: int = 1) -> bool:
+        """
+        Returns True if the axis of a controller is on target.
+        """
+        return self.broker.call(controller_id, "qONT", axe)[axe]
+
+    def start_move(
+        self,
+        controller_id: int,
+        value: float,
+        axe: int = 1,
+        use_profile: bool = True,
+    ) -> None:
+        """
+        Send an absolute move without waiting for it to finish.
+
+        Use wait_on_target() to wait for the end of the move.
+
+        Parameters:
+        - controller_id (int): Index of the controller (1-based).
+        - value (float): Target position.
+        - axe (int): Axis to move. Default is 1.
+        - use_profile (bool): Set the velocity of the motion profile for this
+          move size. False keeps the current velocity (e.g. constant-speed
+          sweeps).
+        """
+        previous = self.targets.get(controller_id)
+        distance = None if previous is None else abs(value - previous)
+        if use_profile and distance is not None:
+            self._apply_profile(controller_id, distance, axe)
+        self.positions.invalidate(controller_id)
+        self.broker.call(
+            controller_id, "MOV", axe, value, priority=PRIORITY_MOTION
+        )
+        self.targets[controller_id] = value
+        self._register_move(controller_id, distance, axe)
+
     def move_abs(self, controller_id: int, value: float, axe: int = 1) -> None:
         """
         Move a controller to an absolute position.
@@ -52,10 +167,8 @@ class PiController:
         - value (float): Target position.
         - axe (int): Axis to move. Default is 1.
         """
-        device = self.devices[controller_id - 1]
-        device.gcscommands.MOV(axe, value)
-        while not device.gcscommands.qONT(axe)[1]:
-            time.sleep(0.005)
+        self.start_move(controller_id, value, axe)
+        self.wait_on_target(controller_id, axe)
 
     def move_rel(self, controller_id: int, value: float, axe: int = 1) -> None:
         """
@@ -66,10 +179,187 @@ class PiController:
         - value (float): Relative movement.
         - axe (int): Axis to move. Default is 1.
         """
-        device = self.devices[controller_id - 1]
-        device.gcscommands.MVR(axe, value)
-        while not device.gcscommands.qONT(axe)[1]:
-            time.sleep(0.005)
+        self._apply_profile(controller_id, abs(value), axe)
+        self.positions.invalidate(controller_id)
+        self.broker.call(
+            controller_id, "MVR", axe, value, priority=PRIORITY_MOTION
+        )
+        if controller_id in self.targets:
+            self.targets[controller_id] += value
+        self._register_move(controller_id, abs(value), axe)
+        self.wait_on_target(controller_id, axe)
+
+    def move_many(self, targets: dict, axe: int = 1) -> Future:
+        """
+        Move several controllers at once.
+
+        All MOV commands are sent back-to-back, then a background thread waits
+        until every axis is on target, so a multi-axis move costs the time of
+        the slowest axis instead of the sum.
+
+        Parameters:
+        - targets (dict): Controller index (1-based) -> absolute target.
+        - axe (int): Axis to move. Default is 1.
+
+        Returns:
+        - Future: Resolved when all controllers are on target. result() raises
+          TimeoutError if one of them never gets there.
+        """
+        for controller_id, value in targets.items():
+            self.start_move(controller_id, value, axe)
+        return self._waiter.submit(self.wait_on_target, list(targets), axe)
+
+    def wait_on_target(
+        self,
+        controller_ids,
+        axe: int = 1,
+        timeout: float = 30.0,
+        min_poll: float = 0.001,
+        max_poll: float = 0.02,
+        settle: bool = True,
+    ) -> None:
+        """
+        Wait until one or several controllers are on target.
+
+        The first qONT is only sent when the move is predicted to end (distance
+        divided by velocity). Polling then starts at min_poll and the interval
+        doubles up to max_poll, which keeps the latency low for short moves
+        without flooding the daisy chain during long ones. The duration of each
+        move is recorded in move_stats.
+
+        With settle, the settle time modeled by the motion profile for the
+        size of each move is then waited after its on-target, so the stages
+        have stopped ringing when this returns.
+
+        Parameters:
+        - controller_ids (int or iterable): Index of the controller(s) (1-based).
+        - axe (int): Axis. Default is 1.
+        - timeout (float): Maximum wait in seconds.
+        - min_poll (float): First polling interval after the predicted arrival.
+        - max_poll (float): Longest polling interval.
+        - settle (bool): Wait the modeled settle time after on-target.
+
+        Raises:
+        - TimeoutError: If a controller is not on target after timeout seconds.
+        """
+        if isinstance(controller_ids, int):
+            controller_ids = [controller_ids]
+        pending = list(controller_ids)
+        if not pending:
+            return
+        now = time.perf_counter()
+        deadline = now + timeout
+        arrivals = [self._predicted_arrival(i, now) for i in pending]
+        delay = min(arrivals) - now
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+
+        polls = 0
+        interval = min_poll
+        settled_at = 0.0
+        while True:
+            polls += 1
+            still_moving = []
+            for controller_id in pending:
+                if self.is_on_target(controller_id, axe):
+                    distance = self._record_move(controller_id, polls)
+                    if settle and self.motion_profile is not None:
+                        settle_time = self.motion_profile.settle_time(
+                            controller_id,
+                            distance,
+                        )
+                        settled_at = max(
+                            settled_at,
+                            time.perf_counter() + settle_time,
+                        )
+                else:
+                    still_moving.append(controller_id)
+            pending = still_moving
+            if not pending:
+                delay = settled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                return
+            if time.perf_counter() > deadline:
+                raise TimeoutError(
+                    f"Devices {pending} not on target after {timeout} s"
+                )
+            time.sleep(interval)
+            interval = min(interval * 2, max_poll)
+
+    def get_move_stats(self, controller_id: int) -> dict:
+        """
+        Summarize the recent moves of a controller.
+
+        Returns:
+        - dict: Number of moves, mean and max duration (s), mean prediction
+          error (s) and mean number of qONT polls per move.
+        """
+        stats = self.move_stats.get(controller_id)
+        if not stats:
+            return {"moves": 0}
+        predicted = [s for s in stats if s[1] is not None]
+        return {
+            "moves": len(stats),
+            "mean_duration": sum(s[0] for s in stats) / len(stats),
+            "max_duration": max(s[0] for s in stats),
+            "mean_prediction_error": (
+                sum(s[0] - s[1] for s in predicted) / len(predicted)
+                if predicted
+                else None
+            ),
+            "mean_polls": sum(s[2] for s in stats) / len(stats),
+        }
+
+    def _velocity(self, controller_id: int, axe: int = 1):
+        if controller_id not in self.velocities:
+            try:
+                velocity = self.broker.call(controller_id, "qVEL", axe)
+                self.velocities[controller_id] = velocity[axe]
+            except Exception:
+                self.velocities[controller_id] = None
+        return self.velocities[controller_id]
+
+    def _apply_profile(self, controller_id: int, distance: float, axe: int = 1):
+        # VEL/ACC are only sent when the setting changes, so a scan made of
+        # equal steps costs no extra command
+        if self.motion_profile is None:
+            return
+        setting = self.motion_profile.select(controller_id, distance)
+        if setting is None:
+            return
+        velocity, acceleration = setting
+        if velocity != self.velocities.get(controller_id):
+            self.set_velocity(controller_id, velocity, axe)
+        if (
+            acceleration is not None
+            and acceleration != self.accelerations.get(controller_id)
+        ):
+            self.set_acceleration(controller_id, acceleration, axe)
+
+    def _register_move(self, controller_id: int, distance, axe: int = 1) -> None:
+        velocity = self._velocity(controller_id, axe)
+        if distance is None or not velocity:
+            predicted = None
+        else:
+            predicted = distance / velocity
+        self._moves[controller_id] = (time.perf_counter(), predicted, distance)
+
+    def _predicted_arrival(self, controller_id: int, now: float) -> float:
+        start, predicted, _ = self._moves.get(controller_id, (now, None, None))
+        if predicted is None:
+            return now
+        return start + predicted
+
+    def _record_move(self, controller_id: int, polls: int):
+        # returns the distance of the move, None if unknown
+        move = self._moves.pop(controller_id, None)
+        if move is None:
+            return None
+        start, predicted, distance = move
+        stats = self.move_stats.setdefault(controller_id, deque(maxlen=1000))
+        stats.append((time.perf_counter() - start, predicted, polls))
+        return distance
 
 
 def search():
@@ -94,3 +384,6 @@ if __name__ == "__main__":
     pi_controller.move_rel(4, 0.01)
     time.sleep(1)
     print("New position (controller 4):", pi_controller.get_pos(4))
+    print("Move stats (controller 4):", pi_controller.get_move_stats(4))
+    print("Daisy chain latency:", pi_controller.broker.get_metrics())
+    pi_controller.close()
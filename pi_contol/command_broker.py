@@ -0,0 +1,166 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Command priorities, lower values are sent first
+PRIORITY_MOTION = 0
+PRIORITY_QUERY = 1
+PRIORITY_POLL = 2
+
+# Read-only commands: identical requests waiting in the queue share one reply
+COALESCABLE = {"qPOS", "qONT", "qVEL"}
+
+
+class CommandBroker:
+    """
+    Single thread owning the PI USB daisy chain.
+
+    Every GCS command is queued with a priority and executed one at a time by
+    the broker thread, so GUI widgets, scan workers and pollers can share the
+    chain without interleaving replies. A read-only query identical to one
+    still waiting in the queue is not sent twice: both callers get the same
+    reply, at the higher of their two priorities. Queue wait and execution
+    times are recorded per command.
+    """
+
+    def __init__(self, devices: list):
+        """
+        Parameters:
+        - devices (list): Connected GCSDevice instances, controller 1 first.
+        """
+        self.devices = devices
+        self.metrics = {}
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="PiBroker", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self, device_id: int, command: str, *args, priority: int = PRIORITY_QUERY
+    ) -> Future:
+        """
+        Queue a GCS command.
+
+        Parameters:
+        - device_id (int): Index of the controller (1-based).
+        - command (str): Name of the pipython gcscommands method (e.g. "MOV").
+        - args: Arguments of the command.
+        - priority (int): One of the PRIORITY_* constants.
+
+        Returns:
+        - Future: Resolved with the reply of the controller.
+        """
+        key = (device_id, command, args)
+        with self._lock:
+            if command in COALESCABLE and key in self._pending:
+                self._metric(command)["coalesced"] += 1
+                future, queued_priority = self._pending[key]
+                if priority < queued_priority:
+                    # re-queue the shared request at the higher priority, the
+                    # entry left behind is skipped once the reply is set
+                    self._pending[key] = (future, priority)
+                    self._queue.put(
+                        (
+                            priority,
+                            next(self._counter),
+                            time.perf_counter(),
+                            key,
+                            future,
+                        )
+                    )
+                return future
+            future = Future()
+            if command in COALESCABLE:
+                self._pending[key] = (future, priority)
+        self._queue.put(
+            (priority, next(self._counter), time.perf_counter(), key, future)
+        )
+        return future
+
+    def call(
+        self,
+        device_id: int,
+        command: str,
+        *args,
+        priority: int = PRIORITY_QUERY,
+        timeout: float = 30.0,
+    ):
+        """
+        Send a GCS command through the queue and wait for its reply.
+        """
+        if threading.current_thread() is self._thread:
+            # called from a command running on the broker thread itself
+            return self._execute(device_id, command, args)
+        return self.submit(device_id, command, *args, priority=priority).result(
+            timeout
+        )
+
+    def get_metrics(self) -> dict:
+        """
+        Returns per-command counts, coalesced requests and mean/max latencies (s).
+        """
+        with self._lock:
+            return {
+                command: {
+                    "count": m["count"],
+                    "coalesced": m["coalesced"],
+                    "mean_wait": m["wait"] / m["count"] if m["count"] else 0.0,
+                    "mean_exec": m["exec"] / m["count"] if m["count"] else 0.0,
+                    "max_latency": m["max_latency"],
+                }
+                for command, m in self.metrics.items()
+            }
+
+    def close(self) -> None:
+        """
+        Stop the broker thread once the queued commands are sent.
+        """
+        self._queue.put((float("inf"), next(self._counter), 0, None, None))
+        self._thread.join()
+
+    def _metric(self, command: str) -> dict:
+        return self.metrics.setdefault(
+            command,
+            {
+                "count": 0,
+                "coalesced": 0,
+                "wait": 0.0,
+                "exec": 0.0,
+                "max_latency": 0.0,
+            },
+        )
+
+    def _execute(self, device_id: int, command: str, args: tuple):
+        return getattr(self.devices[device_id - 1].gcscommands, command)(*args)
+
+    def _run(self):
+        while True:
+            _, _, queued, key, future = self._queue.get()
+            if key is None:
+                break
+            if future.done():
+                # lower priority entry of a query re-queued and already sent
+                continue
+            with self._lock:
+                # later identical queries must get a fresh reply
+                pending = self._pending.get(key)
+                if pending is not None and pending[0] is future:
+                    del self._pending[key]
+            started = time.perf_counter()
+            try:
+                future.set_result(self._execute(*key))
+            except Exception as e:
+                future.set_exception(e)
+            done = time.perf_counter()
+            with self._lock:
+                m = self._metric(key[1])
+                m["count"] += 1
+                m["wait"] += started - queued
+                m["exec"] += done - started
+                m["max_latency"] = max(m["max_latency"], done - queued)
@@ -0,0 +1,440 @@
+"""
+Velocity/acceleration chosen per move size, from a calibration of each axis.
+
+The calibration moves an axis back and forth over several distances with
+several velocities (and accelerations, if the controller supports ACC),
+measures the time from MOV to on-target for each of them, and keeps the
+fastest setting per distance. It is stored in config/motion_calibration.yaml:
+
+    python -m pi_contol.motion_profile calibrate --devices 1 3 4
+
+The settle characterization reads the position continuously after each move
+to measure how long the stage keeps ringing once on target. The resulting
+settle time per move size is waited after every move:
+
+    python -m pi_contol.motion_profile settle --devices 1 3 4 --tolerance 0.0005
+"""
+
+import argparse
+import bisect
+import os
+import statistics
+import time
+
+import yaml
+
+# Settings tried by the calibration, in mm and mm/s
+CALIBRATION_DISTANCES = (0.005, 0.02, 0.1, 0.5, 2.0)
+CALIBRATION_VELOCITIES = (0.5, 1.0, 1.5, 2.5)
+# Accelerations tried, relative to the one of the controller (qACC)
+CALIBRATION_ACCELERATION_FACTORS = (0.5, 1.0, 2.0)
+
+# Position error (mm) below which a stage is settled, and how long (s) the
+# position is recorded after on-target
+SETTLE_TOLERANCE = 0.0005
+SETTLE_RECORD_TIME = 0.5
+
+
+class MotionProfile:
+    """
+    Calibrated move settings of each controller.
+
+    For every controller, a table of rows sorted by distance. A row holds the
+    velocity (and acceleration, None if not set) giving the shortest measured
+    move+settle time for moves up to that distance, and that time.
+
+    The settle model of a controller is a list of rows sorted by distance,
+    holding the time (s) the stage needs after on-target to stay within the
+    settle tolerance.
+    """
+
+    def __init__(
+        self,
+        table: dict = None,
+        settle: dict = None,
+    ):
+        """
+        Parameters:
+        - table: Controller index (1-based) -> list of rows, each a dict with
+          "distance", "velocity", "acceleration" and "time".
+        - settle: Controller index (1-based) -> list of rows, each a dict with
+          "distance" and "settle".
+        """
+        self.table = {}
+        for device_id, rows in (table or {}).items():
+            self.table[int(device_id)] = sorted(rows, key=lambda r: r["distance"])
+        self.settle = {}
+        for device_id, rows in (settle or {}).items():
+            self.settle[int(device_id)] = sorted(rows, key=lambda r: r["distance"])
+
+    @classmethod
+    def load(cls, path: str) -> "MotionProfile":
+        with open(path, "r") as file:
+            data = yaml.safe_load(file) or {}
+        return cls(data.get("axes", {}), data.get("settle", {}))
+
+    def save(
+        self,
+        path: str,
+        sections=("axes", "settle"),
+    ) -> None:
+        """
+        Writes the given sections into path, keeping the others of the file.
+        """
+        try:
+            with open(path, "r") as file:
+                data = yaml.safe_load(file) or {}
+        except FileNotFoundError:
+            data = {}
+        if "axes" in sections:
+            data["axes"] = self.table
+        if "settle" in sections:
+            data["settle"] = self.settle
+        with open(path, "w") as file:
+            yaml.dump(data, file, default_flow_style=False)
+
+    def _row(self, device_id: int, distance: float):
+        rows = self.table.get(device_id)
+        if not rows:
+            return None
+        distances = [row["distance"] for row in rows]
+        # first row covering the distance, the last one for longer moves
+        i = bisect.bisect_left(distances, distance)
+        return rows[min(i, len(rows) - 1)]
+
+    def select(self, device_id: int, distance: float):
+        """
+        Returns the (velocity, acceleration) to use for a move, or None if
+        the controller is not calibrated. acceleration may be None.
+        """
+        row = self._row(device_id, distance)
+        if row is None:
+            return None
+        return row["velocity"], row.get("acceleration")
+
+    def predict(self, device_id: int, distance: float):
+        """
+        Returns the move+settle time (s) of a move, interpolated between the
+        calibrated distances, or None if the controller is not calibrated.
+        """
+        rows = self.table.get(device_id)
+        if not rows:
+            return None
+        if distance <= 0:
+            return 0.0
+        return self._move_time(rows, distance) + self.settle_time(device_id, distance)
+
+    def _move_time(self, rows, distance: float) -> float:
+        distances = [row["distance"] for row in rows]
+        i = bisect.bisect_left(distances, distance)
+        if i == 0:
+            return rows[0]["time"] * distance / rows[0]["distance"]
+        if i == len(rows):
+            # beyond the table: constant velocity after the last distance
+            last = rows[-1]
+            return last["time"] + (distance - last["distance"]) / last["velocity"]
+        low, high = rows[i - 1], rows[i]
+        ratio = (distance - low["distance"]) / (high["distance"] - low["distance"])
+        return low["time"] + ratio * (high["time"] - low["time"])
+
+    def settle_time(self, device_id: int, distance: float) -> float:
+        """
+        Returns the time (s) to wait after on-target for a move, interpolated
+        between the characterized distances (0 if not characterized).
+        """
+        rows = self.settle.get(device_id)
+        if not rows or distance is None or distance <= 0:
+            return 0.0
+        distances = [row["distance"] for row in rows]
+        i = bisect.bisect_left(distances, distance)
+        # outside the characterized range, the closest distance is used
+        if i == 0:
+            return rows[0]["settle"]
+        if i == len(rows):
+            return rows[-1]["settle"]
+        low, high = rows[i - 1], rows[i]
+        ratio = (distance - low["distance"]) / (high["distance"] - low["distance"])
+        return low["settle"] + ratio * (high["settle"] - low["settle"])
+
+
+def read_acceleration(pi_controller, device_id: int):
+    """
+    Returns the acceleration of a controller, None if it does not support ACC.
+    """
+    try:
+        return pi_controller.broker.call(device_id, "qACC", 1)[1]
+    except Exception:
+        return None
+
+
+def time_move(
+    pi_controller,
+    device_id: int,
+    target: float,
+    use_profile: bool = False,
+) -> float:
+    """
+    Returns the time (s) from the MOV command to on-target.
+    """
+    start = time.perf_counter()
+    pi_controller.start_move(device_id, target, use_profile=use_profile)
+    pi_controller.wait_on_target(
+        device_id,
+        min_poll=0.0005,
+        max_poll=0.002,
+        settle=False,
+    )
+    return time.perf_counter() - start
+
+
+def measure_ringdown(
+    pi_controller,
+    device_id: int,
+    target: float,
+    tolerance: float = SETTLE_TOLERANCE,
+    record_time: float = SETTLE_RECORD_TIME,
+    use_profile: bool = True,
+) -> float:
+    """
+    Moves to target, then reads the position as fast as possible once on
+    target.
+
+    Returns:
+    - Time (s) after on-target at which the position error last exceeded
+      tolerance, 0 if it never did.
+    """
+    time_move(pi_controller, device_id, target, use_profile)
+    on_target = time.perf_counter()
+    settle = 0.0
+    while True:
+        now = time.perf_counter()
+        if now - on_target > record_time:
+            break
+        position = pi_controller.get_pos(device_id)
+        if abs(position - target) > tolerance:
+            settle = time.perf_counter() - on_target
+    if settle >= record_time:
+        print(
+            f"[ERROR] Device {device_id} still outside {tolerance} mm after "
+            f"{record_time} s"
+        )
+    return settle
+
+
+def characterize_settle(
+    pi_controller,
+    device_id: int,
+    distances=CALIBRATION_DISTANCES,
+    tolerance: float = SETTLE_TOLERANCE,
+    record_time: float = SETTLE_RECORD_TIME,
+    repeats: int = 3,
+    limits=None,
+):
+    """
+    Measures the ringdown of an axis after moves of each distance.
+
+    The moves use the velocity of the motion profile when pi_controller has
+    one, like during a scan, otherwise the current velocity.
+
+    Parameters:
+    - pi_controller: PiController instance.
+    - device_id: Index of the controller (1-based).
+    - distances: Move sizes to characterize, in mm.
+    - tolerance: Position error (mm) below which the stage is settled.
+    - record_time: Time (s) the position is read after on-target.
+    - repeats: Number of back-and-forth moves per distance (maximum is kept).
+    - limits: (min, max) travel range of the axis.
+
+    Returns:
+    - List of rows (see MotionProfile.settle), one per distance.
+    """
+    origin = pi_controller.get_pos(device_id)
+    direction = 1
+    if limits is not None and origin > (limits[0] + limits[1]) / 2:
+        direction = -1
+
+    rows = []
+    try:
+        for distance in distances:
+            target = origin + direction * distance
+            if limits is not None and not limits[0] <= target <= limits[1]:
+                print(f"[ERROR] {distance} mm is out of range for device {device_id}")
+                continue
+            settles = []
+            for _ in range(repeats):
+                for position in (target, origin):
+                    settles.append(
+                        measure_ringdown(
+                            pi_controller,
+                            device_id,
+                            position,
+                            tolerance,
+                            record_time,
+                        )
+                    )
+            # the worst case, so that a snap never sees the stage ringing
+            row = {"distance": distance, "settle": max(settles)}
+            print(f"Device {device_id}: {row}")
+            rows.append(row)
+    finally:
+        pi_controller.move_abs(device_id, origin)
+    return rows
+
+
+def calibrate_axis(
+    pi_controller,
+    device_id: int,
+    distances=CALIBRATION_DISTANCES,
+    velocities=CALIBRATION_VELOCITIES,
+    accelerations=None,
+    repeats: int = 3,
+    limits=None,
+):
+    """
+    Measures the move+settle time of an axis for each distance and setting.
+
+    The axis moves back and forth around its current position (towards the
+    middle of limits when given, to stay in range). The original velocity and
+    acceleration are restored at the end.
+
+    Parameters:
+    - pi_controller: PiController instance.
+    - device_id: Index of the controller (1-based).
+    - distances: Move sizes to calibrate, in mm.
+    - velocities: Velocities to try, in mm/s.
+    - accelerations: Accelerations to try, in mm/s². Defaults to the
+      current one scaled by CALIBRATION_ACCELERATION_FACTORS. Ignored if the
+      controller does not support ACC.
+    - repeats: Number of back-and-forth moves per setting (median is kept).
+    - limits: (min, max) travel range of the axis.
+
+    Returns:
+    - List of rows (see MotionProfile) with the fastest setting per distance.
+    """
+    original_acceleration = read_acceleration(pi_controller, device_id)
+    if original_acceleration is None:
+        accelerations = (None,)
+    elif accelerations is None:
+        accelerations = tuple(
+            original_acceleration * factor
+            for factor in CALIBRATION_ACCELERATION_FACTORS
+        )
+    origin = pi_controller.get_pos(device_id)
+    original_velocity = pi_controller._velocity(device_id)
+    direction = 1
+    if limits is not None and origin > (limits[0] + limits[1]) / 2:
+        direction = -1
+
+    rows = []
+    try:
+        for distance in distances:
+            target = origin + direction * distance
+            if limits is not None and not limits[0] <= target <= limits[1]:
+                print(f"[ERROR] {distance} mm is out of range for device {device_id}")
+                continue
+            best = None
+            for velocity in velocities:
+                for acceleration in accelerations:
+                    pi_controller.set_velocity(device_id, velocity)
+                    if acceleration is not None:
+                        try:
+                            pi_controller.set_acceleration(device_id, acceleration)
+                        except Exception as e:
+                            # e.g. above the maximum of the controller
+                            print(f"[ERROR] ACC {acceleration} refused: {e}")
+                            continue
+                    times = []
+                    for _ in range(repeats):
+                        times.append(time_move(pi_controller, device_id, target))
+                        times.append(time_move(pi_controller, device_id, origin))
+                    duration = statistics.median(times)
+                    if best is None or duration < best["time"]:
+                        best = {
+                            "distance": distance,
+                            "velocity": velocity,
+                            "acceleration": acceleration,
+                            "time": duration,
+                        }
+            if best is not None:
+                print(f"Device {device_id}: {best}")
+                rows.append(best)
+    finally:
+        pi_controller.move_abs(device_id, origin)
+        if original_velocity:
+            pi_controller.set_velocity(device_id, original_velocity)
+        if original_acceleration is not None:
+            pi_controller.set_acceleration(device_id, original_acceleration)
+    return rows
+
+
+if __name__ == "__main__":
+    from app_func.app_functions import MOTION_CALIBRATION, PI_LIMITS
+    from pi_contol.PiController import PiController
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser(
+        "calibrate",
+        help="measure the move time of each axis",
+    )
+    settle_parser = commands.add_parser(
+        "settle",
+        help="measure the settle time of each axis after on-target",
+    )
+    settle_parser.add_argument(
+        "--tolerance", type=float, default=SETTLE_TOLERANCE
+    )
+    settle_parser.add_argument(
+        "--record-time", type=float, default=SETTLE_RECORD_TIME
+    )
+    calibrate_parser.add_argument(
+        "--velocities", type=float, nargs="+", default=CALIBRATION_VELOCITIES
+    )
+    calibrate_parser.add_argument(
+        "--accelerations",
+        type=float,
+        nargs="+",
+        help="mm/s², defaults to the current one x0.5, x1 and x2",
+    )
+    for command_parser in (calibrate_parser, settle_parser):
+        command_parser.add_argument(
+            "--devices", type=int, nargs="+", default=[1, 3, 4]
+        )
+        command_parser.add_argument("--repeats", type=int, default=3)
+        command_parser.add_argument("--output", default=MOTION_CALIBRATION)
+    args = parser.parse_args()
+
+    pi_controller = PiController()
+    try:
+        if args.command == "calibrate":
+            table = {}
+            for device_id in args.devices:
+                table[device_id] = calibrate_axis(
+                    pi_controller,
+                    device_id,
+                    velocities=args.velocities,
+                    accelerations=args.accelerations,
+                    repeats=args.repeats,
+                    limits=PI_LIMITS.get(device_id),
+                )
+            MotionProfile(table).save(args.output, sections=("axes",))
+            print(f"Motion profile saved in {args.output}")
+        else:
+            profile = MotionProfile()
+            if os.path.exists(args.output):
+                profile = MotionProfile.load(args.output)
+            # moves at the velocities used by the scans
+            pi_controller.motion_profile = profile
+            for device_id in args.devices:
+                profile.settle[device_id] = characterize_settle(
+                    pi_controller,
+                    device_id,
+                    tolerance=args.tolerance,
+                    record_time=args.record_time,
+                    repeats=args.repeats,
+                    limits=PI_LIMITS.get(device_id),
+                )
+            profile.save(args.output, sections=("settle",))
+            print(f"Settle times saved in {args.output}")
+    finally:
+        pi_controller.close()
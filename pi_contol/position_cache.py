@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from pi_contol.command_broker import PRIORITY_POLL
+
+
+class PositionCache:
+    """
+    Last known position and on-target state of every controller.
+
+    Entries are timestamped. A commanded move invalidates the entry of its
+    controller, and a poll started before the invalidation cannot overwrite
+    it with a stale reply.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # device id -> (position, on target, timestamp)
+        self._generations = {}  # device id -> number of invalidations
+
+    def generation(self, device_id: int) -> int:
+        with self._lock:
+            return self._generations.get(device_id, 0)
+
+    def update(
+        self,
+        device_id: int,
+        position: float,
+        on_target: bool,
+        timestamp: float,
+        generation: int = None,
+    ) -> None:
+        """
+        Store a reading. Ignored if the entry was invalidated since generation.
+        """
+        with self._lock:
+            if (
+                generation is not None
+                and generation != self._generations.get(device_id, 0)
+            ):
+                return
+            self._entries[device_id] = (position, on_target, timestamp)
+
+    def invalidate(self, device_id: int) -> None:
+        with self._lock:
+            self._generations[device_id] = self._generations.get(device_id, 0) + 1
+            self._entries.pop(device_id, None)
+
+    def get(self, device_id: int, max_age: float = None):
+        """
+        Returns (position, on target, timestamp), or None if the entry is
+        missing, invalidated or older than max_age seconds.
+        """
+        with self._lock:
+            entry = self._entries.get(device_id)
+        if entry is None:
+            return None
+        if max_age is not None and time.perf_counter() - entry[2] > max_age:
+            return None
+        return entry
+
+
+class PositionPoller:
+    """
+    Single background thread refreshing the position cache of all controllers.
+
+    At each period, qPOS and qONT are queued for every controller at once with
+    the lowest broker priority, so polling never delays motion commands.
+    """
+
+    def __init__(
+        self, pi_controller, interval: float = 0.2, timeout: float = 5.0
+    ):
+        """
+        Parameters:
+        - pi_controller (PiController): Controller owning the broker and cache.
+        - interval (float): Polling period in seconds.
+        - timeout (float): Longest wait for a reply, in seconds. A controller
+          not answering in time is skipped until the next poll.
+        """
+        self.pi_controller = pi_controller
+        self.interval = interval
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="PiPoller", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+
+    def poll(self) -> None:
+        """
+        Query every controller once and update the cache.
+        """
+        broker = self.pi_controller.broker
+        cache = self.pi_controller.positions
+        requests = []
+        for device_id in range(1, len(self.pi_controller.devices) + 1):
+            requests.append(
+                (
+                    device_id,
+                    cache.generation(device_id),
+                    broker.submit(device_id, "qPOS", 1, priority=PRIORITY_POLL),
+                    broker.submit(device_id, "qONT", 1, priority=PRIORITY_POLL),
+                )
+            )
+        deadline = time.perf_counter() + self.timeout
+        for device_id, generation, position, on_target in requests:
+            try:
+                # one deadline for the whole poll, so that stop() stays quick
+                remaining = max(0.0, deadline - time.perf_counter())
+                reading = position.result(remaining)[1]
+                state = on_target.result(
+                    max(0.0, deadline - time.perf_counter())
+                )[1]
+            except FutureTimeoutError:
+                print(f"[ERROR] Device {device_id} did not answer the poll")
+                continue
+            cache.update(
+                device_id,
+                reading,
+                state,
+                time.perf_counter(),
+                generation,
+            )
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[ERROR] Position polling failed: {e}")
+            self._stop.wait(self.interval)
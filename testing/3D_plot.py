@@ -17,15 +17,21 @@ def from_folder_data(
         [],
         [],
     )
-    for img in os.listdir(folder_path):
+    for img in sorted(os.listdir(folder_path)):
+        # the folder also holds the scan checkpoint and, after a crash, its
+        # spill file
+        if not img.endswith(".ome.tif"):
+            continue
         image_path = folder_path + "/" + img
         (
             metadata,
             img_data,
         ) = read_tiff_img(image_path)
-        x.append(metadata.pixels.planes[0].position_x)
-        y.append(metadata.pixels.planes[0].position_y)
-        z.append(metadata.pixels.planes[0].position_z)
+        # a stack file holds one plane per voxel
+        for plane in metadata.pixels.planes:
+            x.append(plane.position_x)
+            y.append(plane.position_y)
+            z.append(plane.position_z)
     return (
         x,
         y,
@@ -29,16 +29,14 @@ task.CreateDOChan(
 # PyDAQmx.DAQmx_Val_ContSamps, samples_per_cycle)
 
 pi_controller = PiController()
-pi_controller.move_abs(1, 11)
-pi_controller.move_abs(2, 80)
-pi_controller.move_abs(
-    3,
-    14.35,
-)
-pi_controller.move_abs(
-    4,
-    16.5,
-)
+pi_controller.move_many(
+    {
+        1: 11,
+        2: 80,
+        3: 14.35,
+        4: 16.5,
+    }
+).result()
 time.sleep(2)
 print("init done")
 samples_written = ct.c_int32()
@@ -0,0 +1,97 @@
+"""
+Cold start benchmark of the application imports.
+
+Each run imports the widgets used by main.py in a fresh Python process and
+measures the time it takes. The median of the runs is appended to a CSV
+file (testing/startup_benchmark.csv by default, not tracked by git) with the
+date and the current git commit, so that the startup time can be followed
+over time.
+
+Usage (from the repository root):
+    python testing/startup_benchmark.py [runs] [--output results.csv]
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "testing", "startup_benchmark.csv")
+
+# Modules only needed when a scan is saved, they should not be imported here
+DEFERRED = ("tifffile", "ome_types", "skimage", "zarr")
+
+SNIPPET = f"""
+import sys, time
+t0 = time.perf_counter()
+import widgets.PiControlWidget, widgets.GalvoWidget, widgets.ScansWidget
+print(time.perf_counter() - t0)
+print(",".join(m for m in {DEFERRED!r} if m in sys.modules))
+"""
+
+
+def cold_import_time():
+    """
+    Returns the import time (s) in a new process and the deferred modules
+    that were loaded anyway.
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    loaded = [m for m in out[1].split(",") if m] if len(out) > 1 else []
+    return float(out[0]), loaded
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("runs", nargs="?", type=int, default=5)
+    parser.add_argument("--output", default=RESULTS, help="CSV file to append to")
+    args = parser.parse_args()
+    runs = args.runs
+
+    times = []
+    for i in range(runs):
+        t, loaded = cold_import_time()
+        times.append(t)
+        print(f"run {i + 1}: {t:.2f} s")
+        if loaded:
+            print(f"[WARNING] Loaded at startup: {', '.join(loaded)}")
+
+    median = statistics.median(times)
+    print(f"median: {median:.2f} s, min: {min(times):.2f} s")
+
+    new_file = not os.path.exists(args.output)
+    with open(args.output, "a", newline="") as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(["date", "commit", "runs", "median_s", "min_s"])
+        writer.writerow(
+            [
+                datetime.datetime.now().isoformat(timespec="seconds"),
+                git_commit(),
+                runs,
+                f"{median:.3f}",
+                f"{min(times):.3f}",
+            ]
+        )
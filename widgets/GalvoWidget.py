@@ -5,15 +5,20 @@ from PyQt5.QtWidgets import (
     QLabel,
     QSlider,
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from galvo.galvo_control import *
+from galvo.galvo_writer import GalvoWriter
 from app_func.app_functions import *
+from app_func.config_store import get_config_store
 import napari
 
 pi_widgets = []
 
 
 class SlidesWidget(QWidget):
+    # emitted by the galvo writer thread once a voltage is applied
+    galvo_applied = pyqtSignal(int, float)
+
     def __init__(self, galvo1_val: float, galvo2_val: float):
         super().__init__()
 
@@ -43,6 +48,10 @@ class SlidesWidget(QWidget):
         set_galvos_position(galvo1_val, galvo_id=1)
         set_galvos_position(galvo2_val, galvo_id=2)
 
+        # Slider moves are applied off the GUI thread, latest value first
+        self.galvo_applied.connect(self.show_galvo_value)
+        self.galvo_writer = GalvoWriter(on_applied=self.galvo_applied.emit)
+
         # Labels
         self.north_south_label = QLabel(self.ns_text)
         self.east_west_label = QLabel(self.es_text)
@@ -83,42 +92,38 @@ class SlidesWidget(QWidget):
 
     def move_north_south(self):
         value = -self.north_south_slider.value() * 0.001
-        set_galvos_position(value=value, galvo_id=2)
-        self.north_south_label.setText(self.ns_text)
-        set_galvos_position(
-            value=value,
-            galvo_id=2,
-        )
-        self.north_south_label.setText(f"Y Axis -/+ :  {value:.3f} V")
+        self.galvo_writer.request(value, galvo_id=2)
 
     def move_east_west(self):
         value = self.east_west_slider.value() * 0.001
-        set_galvos_position(value=value, galvo_id=1)
-        self.east_west_label.setText(f"Y Axis -/+ :  {value:.3f} V")
+        self.galvo_writer.request(value, galvo_id=1)
+
+    def show_galvo_value(self, galvo_id: int, value: float):
+        """
+        Display a voltage once it has actually been written to the galvo.
+        """
+        if galvo_id == 1:
+            self.east_west_label.setText(f"Z Axis -/+ :  {value:.3f} V")
+        else:
+            self.north_south_label.setText(f"Y Axis -/+ :  {value:.3f} V")
 
     def reset_galvos(
         self,
     ):
-        set_galvos_position(
-            0,
-            galvo_id=1,
-        )
-        set_galvos_position(
-            0,
-            galvo_id=2,
-        )
-        self.north_south_label.setText(f"Y Axis -/+ :  {0:.3f} V")
-        self.east_west_label.setText(f"Z Axis -/+ :  {0:.3f} V")
         self.north_south_slider.setValue(0)
         self.east_west_slider.setValue(0)
+        self.galvo_writer.request(0, galvo_id=1)
+        self.galvo_writer.request(0, galvo_id=2)
 
     def save_params(self):
         val_NS = -self.north_south_slider.value() * 0.001
         val_EW = self.east_west_slider.value() * 0.001
-        config = load_yaml(CONFIG)
-        config["galvo1_val"] = val_EW
-        config["galvo2_val"] = val_NS
-        save_yaml(config, CONFIG)
+        get_config_store(CONFIG).update(
+            {
+                "galvo1_val": val_EW,
+                "galvo2_val": val_NS,
+            }
+        )
 
 
 if __name__ == "__main__":
@@ -7,12 +7,34 @@ from PyQt5.QtWidgets import (
     QLabel,
     QLineEdit,
 )
-from app_func.app_functions import load_yaml, save_yaml, CONFIG
+from PyQt5.QtCore import QTimer
+from napari.qt.threading import thread_worker
+from app_func.app_functions import load_yaml, CONFIG, PI_LIMITS
+from app_func.config_store import get_config_store
 from pi_contol.PiController import PiController
-import time
 from widgets.GalvoWidget import pi_widgets
 
 
+@thread_worker
+def stage_move(
+    pi_controller: PiController,
+    controller_id: int,
+    value: float,
+    relative: bool,
+):
+    """
+    Runs a blocking stage move off the Qt thread.
+
+    Returns:
+    - float: Position read from the controller once the move is over.
+    """
+    if relative:
+        pi_controller.move_rel(controller_id, value)
+    else:
+        pi_controller.move_abs(controller_id, value)
+    return pi_controller.get_pos(controller_id)
+
+
 class PIControlWidget(QWidget):
     def __init__(
         self,
@@ -21,15 +43,18 @@ class PIControlWidget(QWidget):
         controller_id: int,
         mini: float,
         maxi: float,
+        move_to_initial: bool = True,
     ):
         super().__init__()
 
         self.limit_step = 4  # Maximum allowed step size for move commands
+        self.move_worker = None  # Move currently running, if any
+        self.pending_steps = 0.0  # Relative clicks merged while moving
+        self.pending_abs = None  # Absolute target requested while moving
         self.pi_controller = pi_controller
         self.controller_id = controller_id
         self.min = mini
         self.max = maxi
-        axe = 1  # Axis, presumably fixed here
 
         # Set window title
         self.setWindowTitle(f"PI Position Control - Device {controller_id}")
@@ -71,13 +96,10 @@ class PIControlWidget(QWidget):
         layout.addWidget(self.step_label)
         layout.addWidget(self.step_input)
 
-        # Move device to initial position
-        self.pi_controller.move_abs(self.controller_id, pi_val)
-        # Wait until motion is complete
-        while not pi_controller.devices[self.controller_id - 1].gcscommands.qONT(axe)[
-            1
-        ]:
-            time.sleep(0.05)
+        # Move device to initial position (returns once on target), unless
+        # it was already done at startup
+        if move_to_initial:
+            self.pi_controller.move_abs(self.controller_id, pi_val)
 
         # Position label and input
         self.position_label = QLabel("Position:")
@@ -104,12 +126,83 @@ class PIControlWidget(QWidget):
         self.send_button.clicked.connect(self.send_position)
         layout.addWidget(self.send_button)
 
+        # Live position read from the shared position cache
+        self.live_label = QLabel("Current: -")
+        layout.addWidget(self.live_label)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_position)
+        self.refresh_timer.start(200)
+
+        # Label to display the in-flight move
+        self.state_label = QLabel("")
+        layout.addWidget(self.state_label)
+
         # Label to display errors
         self.err_display = QLabel("")
         layout.addWidget(self.err_display)
 
         self.setLayout(layout)
 
+    def request_move(self, value: float, relative: bool):
+        """
+        Start a move on a worker thread.
+
+        While a move is running, relative requests are summed into a single
+        relative move and an absolute request replaces them; the merged move
+        is sent as soon as the current one finishes.
+        """
+        if self.move_worker is not None:
+            if not relative:
+                self.pending_abs = value
+                self.pending_steps = 0.0
+            elif self.pending_abs is not None:
+                self.pending_abs += value
+            else:
+                self.pending_steps += value
+            self.state_label.setText("Moving... (next move queued)")
+            return
+
+        self.state_label.setText("Moving...")
+        self.move_worker = stage_move(
+            self.pi_controller, self.controller_id, value, relative
+        )
+        self.move_worker.returned.connect(self.move_done)
+        self.move_worker.errored.connect(self.move_failed)
+        self.move_worker.start()
+
+    def move_done(self, position: float):
+        self.move_worker = None
+        if self.pending_abs is not None:
+            value, relative = self.pending_abs, False
+        elif self.pending_steps:
+            value, relative = self.pending_steps, True
+        else:
+            self.state_label.setText("")
+            self.position_input.setText(str(round(position, 3)))
+            return
+        self.pending_abs = None
+        self.pending_steps = 0.0
+        self.request_move(value, relative)
+
+    def move_failed(self, e):
+        self.move_worker = None
+        self.pending_abs = None
+        self.pending_steps = 0.0
+        self.state_label.setText("")
+        self.err_display.setText(f"Move failed: {e}")
+
+    def refresh_position(self):
+        """
+        Display the cached position, refreshed by the controller poller.
+        """
+        cached = self.pi_controller.positions.get(self.controller_id)
+        if cached is None:
+            self.live_label.setText("Current: -")
+            return
+        position, on_target, _ = cached
+        state = "" if on_target else " (moving)"
+        self.live_label.setText(f"Current: {position:.3f}{state}")
+
     def move_up(self):
         try:
             steps = float(self.step_input.text())
@@ -136,7 +229,7 @@ class PIControlWidget(QWidget):
             self.down_button.setEnabled(True)
 
             if -self.limit_step <= steps <= self.limit_step:
-                self.pi_controller.move_rel(self.controller_id, steps)
+                self.request_move(steps, relative=True)
                 new_val = round(value + steps, 3)
                 self.position_input.setText(str(new_val))
             else:
@@ -170,7 +263,7 @@ class PIControlWidget(QWidget):
             self.down_button.setEnabled(True)
 
             if -self.limit_step <= steps <= self.limit_step:
-                self.pi_controller.move_rel(self.controller_id, -steps)
+                self.request_move(-steps, relative=True)
                 new_val = round(value - steps, 3)
                 self.position_input.setText(str(new_val))
             else:
@@ -191,16 +284,12 @@ class PIControlWidget(QWidget):
         elif position > self.max:
             self.err_display.setText(f"Max is {self.max}")
         else:
-            self.pi_controller.move_abs(self.controller_id, position)
-            time.sleep(1)
-            self.position_input.setText(str(position))
+            self.request_move(position, relative=False)
 
     def save_params(self):
         try:
             val = float(self.position_input.text())
-            config = load_yaml(CONFIG)
-            config[f"pi{self.controller_id}_val"] = val
-            save_yaml(config, CONFIG)
+            get_config_store(CONFIG).update({f"pi{self.controller_id}_val": val})
         except Exception as e:
             self.err_display.setText(f"Error saving params: {e}")
 
@@ -214,14 +303,7 @@ if __name__ == "__main__":
     pi_controller = PiController()
 
     for i in range(1, 5):
-        if i == 1:
-            mini, maxi = 8, 16.999
-        elif i == 2:
-            mini, maxi = -360, 360
-        elif i == 3:
-            mini, maxi = 4, 16.999
-        else:
-            mini, maxi = 0.001, 16.999
+        mini, maxi = PI_LIMITS[i]
 
         pi_widget = PIControlWidget(
             pi_controller, pi_vals[i - 1], controller_id=i, mini=mini, maxi=maxi
@@ -229,4 +311,5 @@ if __name__ == "__main__":
         app.window.add_dock_widget(pi_widget, area="right")
         pi_widgets.append(pi_widget)
 
+    pi_controller.start_polling(float(params.get("pi_poll_interval", 0.2)))
     napari.run()
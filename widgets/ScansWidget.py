@@ -1,6 +1,5 @@
-import yaml
 import os
-from app_func.flip_mirror import switch_mirror
+from app_func.flip_mirror import get_mirror
 from PyQt5.QtWidgets import (
     QWidget,
     QPushButton,
@@ -12,6 +11,7 @@ from PyQt5.QtWidgets import (
     QFileDialog,
     QHBoxLayout,
     QComboBox,
+    QProgressBar,
 )
 from PyQt5.QtCore import Qt
 import napari
@@ -22,8 +22,102 @@ from pymmcore_plus import (
 from pi_contol.PiController import (
     PiController,
 )
-from app_func.pi_ni_scan import brillouin_scan, scan
+from app_func.pi_ni_scan import (
+    BRILLOUIN_ROI,
+    ZXY_DEVICES,
+    brillouin_scan,
+    scan,
+)
+from app_func.scan_plan import ORDERS, ScanPlan
+from app_func.scan_writer import FILE_FORMATS, spill_bytes
 from app_func.app_functions import B_PARAMS, F_PARAMS
+from app_func.config_store import get_config_store
+from app_func.camera_sequence import camera_readout
+from app_func.checkpoint import ScanCheckpoint
+from app_func.scan_progress import STOP, format_duration, format_progress
+
+
+class ScanControls(QWidget):
+    """
+    Progress bar, ETA and pause/cancel buttons of a running scan worker.
+
+    The scan functions are generator workers yielding a ScanProgress dict
+    after each voxel or plane; pausing and cancelling take effect at the
+    next one.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.worker = None
+
+        self.progress_bar = QProgressBar()
+        self.progress_label = QLabel("")
+
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.pause_btn)
+        buttons.addWidget(self.cancel_btn)
+        buttons.setContentsMargins(0, 0, 0, 0)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.progress_label)
+        layout.addLayout(buttons)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.set_running(False)
+
+    @property
+    def running(self) -> bool:
+        return self.worker is not None
+
+    def attach(self, worker):
+        """
+        Follows a scan worker until it finishes. Call before worker.start().
+        """
+        self.worker = worker
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+        worker.yielded.connect(self.show_progress)
+        worker.finished.connect(lambda: self.set_running(False))
+        self.set_running(True)
+
+    def show_progress(self, progress: dict):
+        self.progress_bar.setMaximum(max(progress["total"], 1))
+        self.progress_bar.setValue(progress["done"])
+        self.progress_label.setText(format_progress(progress))
+
+    def toggle_pause(self):
+        if self.worker is None:
+            return
+        if self.worker.is_paused:
+            self.worker.resume()
+            self.pause_btn.setText("Pause")
+        else:
+            self.worker.pause()
+            self.pause_btn.setText("Resume")
+
+    def cancel(self):
+        """
+        Stops the scan at the next voxel or plane.
+        """
+        if self.worker is None:
+            return
+        self.worker.send(STOP)
+        if self.worker.is_paused:
+            self.worker.resume()
+        self.progress_label.setText("Stopping...")
+
+    def set_running(self, running: bool):
+        if not running:
+            self.worker = None
+        self.pause_btn.setText("Pause")
+        self.pause_btn.setEnabled(running)
+        self.cancel_btn.setEnabled(running)
 
 
 class ScanBTNWidget(QWidget):
@@ -206,6 +300,16 @@ class ScanWidget(QWidget):
         self.z_step_input = QLineEdit()
         self.exposure_input = QLineEdit()
 
+        # Output file format (one file per voxel or a single stack)
+        self.format_input = QComboBox()
+        self.format_input.addItems(
+            [name for name in FILE_FORMATS if name != "plane"]
+        )
+
+        # Order in which the voxels are visited
+        self.order_input = QComboBox()
+        self.order_input.addItems(ORDERS)
+
         # Info labels with valid ranges
         self.info_label = QLabel("4<=X<17 mm   |   0<Y<17 mm   |   8<=Z<17 mm")
         self.info_label.setStyleSheet(
@@ -242,6 +346,8 @@ class ScanWidget(QWidget):
         form_layout.addRow("Z Step (µm):", self.z_step_input)
         form_layout.addRow("camera:", self.camera_input)
         form_layout.addRow("exposure (ms):", self.exposure_input)
+        form_layout.addRow("file format:", self.format_input)
+        form_layout.addRow("scan order:", self.order_input)
 
         # Buttons for saving parameters and running scan
         self.save_btn = QPushButton("Save Parameters")
@@ -257,7 +363,16 @@ class ScanWidget(QWidget):
         self.save_btn.clicked.connect(self.save_parameters)
 
         self.run_btn = QPushButton("Run scan")
-        self.run_btn.clicked.connect(self.run_scan)
+        self.run_btn.clicked.connect(lambda: self.run_scan())
+
+        # Continue an interrupted scan saved in the same folder
+        self.resume_btn = QPushButton("Resume scan")
+        self.resume_btn.clicked.connect(lambda: self.run_scan(resume=True))
+
+        # Duration, frame count and disk size of the scan, before running it
+        self.check_btn = QPushButton("Check scan")
+        self.check_btn.clicked.connect(lambda: self.preflight())
+        self.estimate_label = QLabel("")
 
         self.disp_label = QLabel("")
 
@@ -288,7 +403,12 @@ class ScanWidget(QWidget):
         main_layout.addLayout(form_layout)
         main_layout.addLayout(layout)
         main_layout.addWidget(self.save_btn)
+        main_layout.addWidget(self.check_btn)
+        main_layout.addWidget(self.estimate_label)
         main_layout.addWidget(self.run_btn)
+        main_layout.addWidget(self.resume_btn)
+        self.controls = ScanControls()
+        main_layout.addWidget(self.controls)
         main_layout.addWidget(self.disp_label)
         self.setLayout(main_layout)
 
@@ -330,10 +450,11 @@ class ScanWidget(QWidget):
                     "folder prefix": self.folder_prefix_input.text(),
                     "exposure": float(self.exposure_input.text()),
                     "camera": self.camera_input.currentText(),
+                    "file format": self.format_input.currentText(),
+                    "order": self.order_input.currentText(),
                 }
 
-                with open(self.filepath, "w") as file:
-                    yaml.dump(params, file, default_flow_style=False)
+                get_config_store(self.filepath).replace(params)
 
                 self.disp_label.setText("Parameters saved!")
             else:
@@ -346,12 +467,12 @@ class ScanWidget(QWidget):
         """
         Load scan parameters from the YAML file and populate the input fields.
         """
-        if not os.path.exists(self.filepath):
+        store = get_config_store(self.filepath)
+        if not store.exists():
             return
 
         try:
-            with open(self.filepath, "r") as file:
-                params = yaml.safe_load(file)
+            params = store.data()
 
             self.br_x_input.setText(str(params["bottom_right_corner"]["x"]))
             self.br_y_input.setText(str(params["bottom_right_corner"]["y"]))
@@ -374,16 +495,97 @@ class ScanWidget(QWidget):
                 self.camera_input.setCurrentText(self.cameras[0])
 
             self.exposure_input.setText(str(params["exposure"]))
+            self.format_input.setCurrentText(params.get("file format", "voxel"))
+            self.order_input.setCurrentText(params.get("order", "snake"))
 
             self.disp_label.setText("Parameters loaded.")
 
         except Exception as e:
             self.disp_label.setText(f"Failed to load parameters: {e}")
 
-    def run_scan(self):
+    def preflight(self):
+        """
+        Builds the scan plan from the entered parameters, checks it against
+        the stage limits and displays its predicted duration and size.
+
+        Returns:
+        - The ScanPlan, or None if the parameters are invalid.
+        """
+        try:
+            plan = ScanPlan(
+                (
+                    float(self.br_x_input.text()),
+                    float(self.br_y_input.text()),
+                    float(self.br_z_input.text()),
+                ),
+                (
+                    float(self.ul_x_input.text()),
+                    float(self.ul_y_input.text()),
+                    float(self.ul_z_input.text()),
+                ),
+                (
+                    float(self.x_step_input.text()),
+                    float(self.y_step_input.text()),
+                    float(self.z_step_input.text()),
+                ),
+                order=self.order_input.currentText(),
+            )
+            exposure = float(self.exposure_input.text()) / 1000
+        except ValueError:
+            self.estimate_label.setText("Parameters must be float")
+            return None
+
+        errors = plan.validate()
+        if errors:
+            self.estimate_label.setText("Out of stage limits: " + "; ".join(errors))
+            return None
+
+        _, _, width, height = BRILLOUIN_ROI
+        frame_bytes = width * height * self.core.getBytesPerPixel()
+        estimate = plan.estimate(
+            exposure,
+            frame_bytes,
+            readout=camera_readout(self.core),
+            motion_profile=self.pi_controller.motion_profile,
+            devices=ZXY_DEVICES,
+        )
+        moves = ", ".join(
+            f"{order} {format_duration(report['time'])}"
+            f" ({report['travel'].sum():.1f} mm)"
+            for order, report in plan.compare_orders(
+                motion_profile=self.pi_controller.motion_profile,
+                devices=ZXY_DEVICES,
+            ).items()
+        )
+        # frames not saved for good yet are also kept in the spill file
+        spill = min(
+            spill_bytes(self.format_input.currentText(), frame_bytes),
+            estimate["bytes"],
+        )
+        nz, nx, ny = plan.shape
+        self.estimate_label.setText(
+            f"{estimate['frames']} frames ({nz} Z x {nx} X x {ny} Y) - "
+            f"~{format_duration(estimate['duration'])} - "
+            f"{estimate['bytes'] / 1e9:.2f} GB "
+            f"(+ {spill / 1e9:.2f} GB spill file)\n"
+            f"Stage moves: {moves}"
+        )
+        return plan
+
+    def run_scan(
+        self,
+        resume: bool = False,
+    ):
         """
         Start the scan process using the entered parameters.
+
+        Parameters:
+        - resume: Continue the interrupted scan of the saving folder, only
+          acquiring the voxels that were not saved.
         """
+        if self.controls.running:
+            self.disp_label.setText("A scan is already running")
+            return
         try:
             self.core.setExposure(float(self.exposure_input.text()))
 
@@ -405,19 +607,34 @@ class ScanWidget(QWidget):
             else:
                 self.core.setCameraDevice(self.cameras[0])
 
+            # check the whole trajectory before moving anything
+            if self.preflight() is None:
+                self.disp_label.setText("Scan not started")
+                return
+
             self.disp_label.setText("Running and computing...")
 
             self.full_path = (
                     self.path_input.text() + "/" + self.folder_prefix_input.text()
             )
+            checkpoint = ScanCheckpoint(self.full_path)
+            if resume and not checkpoint.exists():
+                self.disp_label.setText(f"No scan to resume in {self.full_path}")
+                return
+            if not resume and checkpoint.interrupted():
+                # a new scan would overwrite its files and spill file
+                self.disp_label.setText(
+                    f"{self.full_path} holds an interrupted scan: use Resume "
+                    f"scan, or choose another folder"
+                )
+                return
             if not os.path.isdir(self.full_path):
                 os.makedirs(self.full_path)
 
             if "QUEST" in self.camera_input.currentText().upper():
-                switch_mirror(1)
+                get_mirror().set_state(1)
             else:
-                print("ok")
-                switch_mirror(0)
+                get_mirror().set_state(0)
 
             worker = brillouin_scan(
                 self.pi_controller,
@@ -432,9 +649,17 @@ class ScanWidget(QWidget):
                 s_y,
                 s_z,
                 self.full_path,
+                file_format=self.format_input.currentText(),
+                resume=resume,
+                order=self.order_input.currentText(),
             )
+            # an interrupted scan can be continued with "Resume scan"
+            worker.errored.connect(
+                lambda e: self.disp_label.setText(f"Scan stopped: {e}")
+            )
+            worker.returned.connect(lambda done: self.scan_state(0 if done else 2))
+            self.controls.attach(worker)
             worker.start()
-            worker.signals.finished.connect(lambda: self.scan_state(0))
 
         except Exception as e:
             self.disp_label.setText(f"Invalid parameters: {e}")
@@ -446,6 +671,11 @@ class ScanWidget(QWidget):
         """
         if state == 0:
             self.disp_label.setText(f"Scan done! Images saved at {self.full_path}")
+        if state == 2:
+            self.disp_label.setText(
+                f"Scan cancelled, use Resume scan to continue. "
+                f"Images saved at {self.full_path}"
+            )
 
     def select_folder(self):
         """
@@ -630,6 +860,20 @@ class FastScanWidget(QWidget):
             "frequency (Hz):",
             self.freq_input,
         )
+        self.format_input = QComboBox()
+        self.format_input.addItems(
+            [name for name in FILE_FORMATS if name != "voxel"]
+        )
+        form_layout.addRow(
+            "file format:",
+            self.format_input,
+        )
+        self.mode_input = QComboBox()
+        self.mode_input.addItems(["snap", "sequenced", "continuous"])
+        form_layout.addRow(
+            "acquisition mode:",
+            self.mode_input,
+        )
 
         self.save_btn = QPushButton()
         self.save_btn.setText("Save Parameters")
@@ -690,6 +934,8 @@ class FastScanWidget(QWidget):
         main_layout.addLayout(layout)
         main_layout.addWidget(self.save_btn)
         main_layout.addWidget(self.run_btn)
+        self.controls = ScanControls()
+        main_layout.addWidget(self.controls)
         main_layout.addWidget(self.disp_label)
         self.setLayout(main_layout)
 
@@ -698,6 +944,9 @@ class FastScanWidget(QWidget):
     def run_scan(
         self,
     ):
+        if self.controls.running:
+            self.disp_label.setText("A scan is already running")
+            return
         try:
             self.core.setExposure(float(self.exposure_input.text()))
             # if self.disp_label.text() == "Parameters saved !":
@@ -721,7 +970,7 @@ class FastScanWidget(QWidget):
             )
             if not os.path.isdir(self.full_path):
                 os.makedirs(self.full_path)
-            switch_mirror(0)
+            get_mirror().set_state(0)
             worker = scan(
                 self.pi_controller,
                 self.core,
@@ -735,9 +984,15 @@ class FastScanWidget(QWidget):
                 10000,
                 path=self.full_path,
                 duration=dur,
+                file_format=self.format_input.currentText(),
+                mode=self.mode_input.currentText(),
+            )
+            worker.errored.connect(
+                lambda e: self.disp_label.setText(f"Scan stopped: {e}")
             )
+            worker.returned.connect(lambda done: self.scan_state(0 if done else 2))
+            self.controls.attach(worker)
             worker.start()
-            worker.signals.finished.connect(lambda: self.scan_state(0))
 
             # else:
             #    self.disp_label.setText("Please save parameters first")
@@ -750,6 +1005,10 @@ class FastScanWidget(QWidget):
     ):
         if state == 0:
             self.disp_label.setText("Scan done ! images saved at " + self.full_path)
+        if state == 2:
+            self.disp_label.setText(
+                "Scan cancelled ! images saved at " + self.full_path
+            )
 
     def select_folder(
         self,
@@ -765,15 +1024,12 @@ class FastScanWidget(QWidget):
     def load_parameters(
         self,
     ):
-        if not os.path.exists(self.filepath):
+        store = get_config_store(self.filepath)
+        if not store.exists():
             return
 
         try:
-            with open(
-                self.filepath,
-                "r",
-            ) as file:
-                params = yaml.safe_load(file)
+            params = store.data()
 
             self.br_x_input.setText(str(params["bottom_right_corner"]["x"]))
             self.br_y_input.setText(str(params["bottom_right_corner"]["y"]))
@@ -791,6 +1047,8 @@ class FastScanWidget(QWidget):
             self.folder_prefix_input.setText(params["folder prefix"])
 
             self.freq_input.setText(str(params["freq"]))
+            self.format_input.setCurrentText(params.get("file format", "plane"))
+            self.mode_input.setCurrentText(params.get("mode", "snap"))
 
             self.disp_label.setText("Parameters loaded.")
 
@@ -842,18 +1100,12 @@ class FastScanWidget(QWidget):
                     "folder prefix": self.folder_prefix_input.text(),
                     "freq": float(self.freq_input.text()),
                     "duration": d,
-                    "exposure": exp
+                    "exposure": exp,
+                    "file format": self.format_input.currentText(),
+                    "mode": self.mode_input.currentText(),
                 }
 
-                with open(
-                    self.filepath,
-                    "w",
-                ) as file:
-                    yaml.dump(
-                        params,
-                        file,
-                        default_flow_style=False,
-                    )
+                get_config_store(self.filepath).replace(params)
                 self.disp_label.setText("Parameters saved !")
 
             else:
@@ -53,14 +53,7 @@ if __name__ == "__main__":
 
     # Create and add PI widgets
     for i in range(1, 5):
-        if i == 1:
-            mini, maxi = 8, 16.999
-        elif i == 2:
-            mini, maxi = -360, 360
-        elif i == 3:
-            mini, maxi = 4, 16.999
-        else:
-            mini, maxi = 0.001, 16.999
+        mini, maxi = PI_LIMITS[i]
 
         pi_widget = PIControlWidget(
             pi_controller,
@@ -72,6 +65,9 @@ if __name__ == "__main__":
         app.window.add_dock_widget(pi_widget, area="right")
         pi_widgets.append(pi_widget)
 
+    # Refresh the shared position cache in the background
+    pi_controller.start_polling(float(params.get("pi_poll_interval", 0.2)))
+
     # Create and add galvo control widget
     sl_widget = SlidesWidget(galvo1_val, galvo2_val)
     app.window.add_dock_widget(sl_widget, area="left")